@@ -0,0 +1,561 @@
+import re
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, Sequence
+
+from openpyxl.utils.cell import column_index_from_string, get_column_letter
+
+from dependency_graph import node_key, sort_dependencies_by_formula_order
+from trace_result import TraceNode, TraceResult
+from range_index import RangeIntervalIndex
+
+# 陣列儲存的依賴圖：百萬節點的完整掃描若以 {"file","sheet","cell"} dict 與路徑字串 tuple 表示，
+# 光是 dict / 字串本身就要數 GB。這裡檔案與工作表名稱各只存一份，節點以整數 id 表示，
+# 位址存成 (工作表槽位, min_row, min_col, max_row, max_col) 整數欄位，邊以 CSR（offsets + targets）保存。
+# 單一儲存格的查詢索引是排序過的 64 位元整數陣列；數值存在 double 陣列，值儲存格的顯示內容由值推導。
+
+_ADDRESS_RE = re.compile(
+    r"^(?:(?P<col1>[A-Z]{1,3})(?P<row1>\d+)(?::(?P<col2>[A-Z]{1,3})(?P<row2>\d+))?"
+    r"|(?P<cols1>[A-Z]{1,3}):(?P<cols2>[A-Z]{1,3})"
+    r"|(?P<rows1>\d+):(?P<rows2>\d+))$"
+)
+
+_FLAG_TRACED = 1
+_FLAG_FORMULA = 2
+_FLAG_RANGE = 4           # 位址含冒號（A1:A1 與 A1 是不同節點）
+_FLAG_NUMBER = 8          # 值存在 _numbers
+_FLAG_INTEGER = 16        # _numbers 中的值原本是 int
+_FLAG_VALUE_CONTENT = 32  # 顯示內容等於由值推導的字串，不另外保存
+
+_ROW_BITS = 21  # 1048576 列
+_COL_BITS = 15  # 16384 欄
+_MAX_EXACT_INT = 2 ** 53
+_EXCEL_MAX_ROW = 1048576
+_EXCEL_MAX_COL = 16384
+# 新加入的儲存格先放在 dict，超過已排序索引的 1/4（且至少此數量）時才併入排序陣列
+MERGE_MIN_PENDING = 4096
+
+
+def _parse_address(cell):
+    """正規化位址 → (min_row, min_col, max_row, max_col, 是否範圍)；整欄 / 整列缺少的部分為 0，無法解析時返回 None"""
+    match = _ADDRESS_RE.match(cell)
+    if not match:
+        return None
+    col1, row1, col2, row2, cols1, cols2, rows1, rows2 = match.groups()
+    if col1:
+        min_row, min_col = int(row1), column_index_from_string(col1)
+        if col2 is None:
+            return min_row, min_col, min_row, min_col, False
+        return min_row, min_col, int(row2), column_index_from_string(col2), True
+    if cols1:
+        return 0, column_index_from_string(cols1), 0, column_index_from_string(cols2), True
+    return int(rows1), 0, int(rows2), 0, True
+
+
+def _value_content(value):
+    """與 _trace_cell 對非公式儲存格的顯示內容相同：文字加單引號，其他轉成字串"""
+    return f"'{value}'" if isinstance(value, str) else str(value)
+
+
+def _format_address(min_row, min_col, max_row, max_col, is_range):
+    if not min_row:
+        return f"{get_column_letter(min_col)}:{get_column_letter(max_col)}"
+    if not min_col:
+        return f"{min_row}:{max_row}"
+    start = f"{get_column_letter(min_col)}{min_row}"
+    if not is_range:
+        return start
+    return f"{start}:{get_column_letter(max_col)}{max_row}"
+
+
+class _NodeView(Mapping):
+    """key -> TraceNode（只含已追蹤的節點），TraceNode 與任務 dict 在存取時才建立"""
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __getitem__(self, key):
+        node_id = self._graph.node_id(key)
+        if node_id is None or not self._graph._flags[node_id] & _FLAG_TRACED:
+            raise KeyError(key)
+        return self._graph.trace_node(node_id)
+
+    def __contains__(self, key):
+        return key in self._graph
+
+    def __iter__(self):
+        graph = self._graph
+        return (graph.key(node_id) for node_id in range(graph.node_count) if graph._flags[node_id] & _FLAG_TRACED)
+
+    def __len__(self):
+        return self._graph._traced_count
+
+
+class _EdgeView(Mapping):
+    """key -> 依公式順序排列的子任務列表（只含已追蹤的節點）"""
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __getitem__(self, key):
+        node_id = self._graph.node_id(key)
+        if node_id is None or not self._graph._flags[node_id] & _FLAG_TRACED:
+            raise KeyError(key)
+        return [self._graph.task(child_id) for child_id in self._graph.child_ids(node_id)]
+
+    def __contains__(self, key):
+        return key in self._graph
+
+    def __iter__(self):
+        return iter(self._graph.nodes)
+
+    def __len__(self):
+        return self._graph._traced_count
+
+
+class _RootList(Sequence):
+    """根節點 key 列表；內部只保存節點 id"""
+
+    def __init__(self, graph):
+        self._graph = graph
+        self.ids = array('i')
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._graph.key(node_id) for node_id in self.ids[index]]
+        return self._graph.key(self.ids[index])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, key):
+        node_id = self._graph.node_id(key)
+        return node_id is not None and node_id in self.ids
+
+    def append(self, key):
+        self.ids.append(self._graph.intern(key))
+
+
+class CompactGraph(TraceResult):
+    """
+    以陣列保存的依賴圖，可取代 DependencyGraph（add_result / roots / children / cyclic_nodes）
+    與 TraceResult（nodes / edges / walk / to_dict 等，渲染器與樹狀檢視可直接使用）。
+    節點 id 依第一次出現的順序編號；子節點以 offsets / counts 指向共用的 targets 陣列，
+    同一節點重新 add_result 時舊的邊留在 targets 中成為空洞，compact() 可重新整理。
+    子任務以節點的標準任務（第一次遇到的檔案路徑、實際工作表名稱、正規化位址）重建。
+    """
+
+    def __init__(self):
+        self._file_names = []         # file_id -> 第一次遇到的檔案路徑
+        self._file_keys = []          # file_id -> os.path.normcase 後的路徑
+        self._file_ids = {}           # os.path.normcase 後的路徑 -> file_id
+        self._sheet_names = []        # sheet_id -> 工作表名稱
+        self._sheet_ids = {}          # 工作表名稱 -> sheet_id
+        self._slots = []              # 槽位 -> (file_id, sheet_id)
+        self._slot_ids = {}           # (file_id, 工作表小寫) -> 槽位
+        self._cell_keys = array('q')  # 排序過的 (槽位, row, col) 封裝整數
+        self._cell_ids = array('i')   # 與 _cell_keys 對應的 node_id
+        self._pending_cells = {}      # 尚未併入排序陣列的 封裝整數 -> node_id
+        self._lookup = {}             # 範圍與無法解析的位址：(槽位, 位址) -> node_id
+        self._raw_cells = {}          # node_id -> 無法解析成位址的 cell 字串（如 #REF!）
+
+        self._node_slots = array('i')
+        self._min_rows = array('i')
+        self._min_cols = array('i')
+        self._max_rows = array('i')
+        self._max_cols = array('i')
+        self._flags = bytearray()
+        self._contents = []           # 公式與其他無法由值推導的顯示內容，其餘為 None
+        self._numbers = array('d')
+        self._other_values = {}       # node_id -> 非數值的實際值
+        self._traced_count = 0
+
+        self._offsets = array('q')
+        self._counts = array('i')
+        self._targets = array('i')
+
+        self.nodes = _NodeView(self)
+        self.edges = _EdgeView(self)
+        self.roots = _RootList(self)
+        self._cyclic_nodes = None
+        self._range_index = None  # (RangeIntervalIndex, {(槽位, 邊界): [node_id]})，查詢時才建立
+
+    @classmethod
+    def from_graph(cls, graph):
+        """從 DependencyGraph 或 TraceResult 建立（邊的順序沿用原圖）"""
+        compact = cls()
+        if isinstance(graph, TraceResult):
+            items = ((key, node.task, node.is_formula, node.content, node.actual_value) for key, node in graph.nodes.items())
+        else:
+            items = ((key, graph.tasks[key]) + tuple(graph.results[key][1:]) for key in graph.results)
+        for key, task, is_formula, content, actual_value in items:
+            compact._set_result(compact.intern(task), is_formula, content, actual_value, graph.children(key))
+        for key in graph.roots:
+            compact.roots.append(key)
+        compact.compact()
+        return compact
+
+    # --- 節點 id ---
+
+    @property
+    def node_count(self):
+        """所有節點數（含只作為引用出現、尚未追蹤的節點）"""
+        return len(self._node_slots)
+
+    @property
+    def edge_count(self):
+        return sum(self._counts)
+
+    def _slot(self, file_key, file_path, sheet_name, intern):
+        file_id = self._file_ids.get(file_key)
+        if file_id is None:
+            if not intern:
+                return None
+            file_id = self._file_ids[file_key] = len(self._file_names)
+            self._file_names.append(file_path)
+            self._file_keys.append(file_key)
+        slot_key = (file_id, sheet_name.lower())
+        slot = self._slot_ids.get(slot_key)
+        if slot is None:
+            if not intern:
+                return None
+            sheet_id = self._sheet_ids.get(sheet_name)
+            if sheet_id is None:
+                sheet_id = self._sheet_ids[sheet_name] = len(self._sheet_names)
+                self._sheet_names.append(sheet_name)
+            slot = self._slot_ids[slot_key] = len(self._slots)
+            self._slots.append((file_id, sheet_id))
+        return slot
+
+    def _locate(self, task_or_key, intern):
+        """返回 (槽位, 查詢鍵, 位址欄位)；單一儲存格的查詢鍵是整數。intern=False 且檔案 / 工作表未出現過時槽位為 None"""
+        if isinstance(task_or_key, dict):
+            file_path, sheet_name = task_or_key["file"], task_or_key["sheet"]
+            key = node_key(task_or_key)
+        else:
+            key = task_or_key
+            file_path, sheet_name = key[0], key[1]
+        slot = self._slot(key[0], file_path, sheet_name, intern)
+        if slot is None:
+            return None, None, None
+        bounds = _parse_address(key[2])
+        if bounds is None or bounds[2] >= 1 << _ROW_BITS or bounds[3] >= 1 << _COL_BITS:
+            return slot, (slot, key[2]), None
+        if bounds[4]:
+            return slot, (slot, key[2]), bounds
+        return slot, (((slot << _ROW_BITS) | bounds[0]) << _COL_BITS) | bounds[1], bounds
+
+    def _find(self, lookup):
+        if lookup.__class__ is not int:
+            return self._lookup.get(lookup)
+        node_id = self._pending_cells.get(lookup)
+        if node_id is None:
+            keys = self._cell_keys
+            i = bisect_left(keys, lookup)
+            if i < len(keys) and keys[i] == lookup:
+                node_id = self._cell_ids[i]
+        return node_id
+
+    def _register(self, lookup, node_id):
+        if lookup.__class__ is not int:
+            self._lookup[lookup] = node_id
+            return
+        self._pending_cells[lookup] = node_id
+        if len(self._pending_cells) > max(MERGE_MIN_PENDING, len(self._cell_keys) >> 2):
+            self._merge_pending_cells()
+
+    def _merge_pending_cells(self):
+        keys = self._cell_keys.tolist() + list(self._pending_cells)
+        ids = self._cell_ids.tolist() + list(self._pending_cells.values())
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._cell_keys = array('q', [keys[i] for i in order])
+        self._cell_ids = array('i', [ids[i] for i in order])
+        self._pending_cells.clear()
+
+    def node_id(self, task_or_key):
+        """任務 dict 或 node_key 對應的節點 id；不存在時返回 None"""
+        slot, lookup, _ = self._locate(task_or_key, False)
+        return None if slot is None else self._find(lookup)
+
+    def intern(self, task_or_key):
+        """返回節點 id，節點不存在時新增（尚未追蹤）"""
+        slot, lookup, bounds = self._locate(task_or_key, True)
+        node_id = self._find(lookup)
+        if node_id is not None:
+            return node_id
+        node_id = len(self._node_slots)
+        self._register(lookup, node_id)
+        if bounds is None:
+            self._raw_cells[node_id] = lookup[1]
+            bounds = (0, 0, 0, 0, False)
+        self._node_slots.append(slot)
+        self._min_rows.append(bounds[0])
+        self._min_cols.append(bounds[1])
+        self._max_rows.append(bounds[2])
+        self._max_cols.append(bounds[3])
+        self._flags.append(_FLAG_RANGE if bounds[4] else 0)
+        if bounds[4]:
+            self._range_index = None
+        self._contents.append(None)
+        self._numbers.append(0.0)
+        self._offsets.append(len(self._targets))
+        self._counts.append(0)
+        return node_id
+
+    def _cell(self, node_id):
+        raw = self._raw_cells.get(node_id)
+        if raw is not None:
+            return raw
+        return _format_address(self._min_rows[node_id], self._min_cols[node_id], self._max_rows[node_id],
+                               self._max_cols[node_id], self._flags[node_id] & _FLAG_RANGE)
+
+    def key(self, node_id):
+        """node_key 格式的 (正規化路徑, 工作表小寫, 位址)"""
+        file_id, sheet_id = self._slots[self._node_slots[node_id]]
+        return (self._file_keys[file_id], self._sheet_names[sheet_id].lower(), self._cell(node_id))
+
+    def task(self, node_id):
+        """節點的標準任務 dict（每次建立新的 dict）"""
+        file_id, sheet_id = self._slots[self._node_slots[node_id]]
+        return {"file": self._file_names[file_id], "sheet": self._sheet_names[sheet_id], "cell": self._cell(node_id)}
+
+    def bounds(self, node_id):
+        """(file_id, sheet_id, min_row, min_col, max_row, max_col)；整欄 / 整列缺少的部分為 0"""
+        file_id, sheet_id = self._slots[self._node_slots[node_id]]
+        return (file_id, sheet_id, self._min_rows[node_id], self._min_cols[node_id],
+                self._max_rows[node_id], self._max_cols[node_id])
+
+    def is_traced(self, node_id):
+        return bool(self._flags[node_id] & _FLAG_TRACED)
+
+    def child_ids(self, node_id):
+        offset = self._offsets[node_id]
+        return self._targets[offset:offset + self._counts[node_id]]
+
+    def value(self, node_id):
+        """節點的實際值（工作表中的快取值）"""
+        flags = self._flags[node_id]
+        if flags & _FLAG_NUMBER:
+            number = self._numbers[node_id]
+            return int(number) if flags & _FLAG_INTEGER else number
+        return self._other_values.get(node_id)
+
+    def content(self, node_id):
+        """節點的顯示內容（公式、值或範圍摘要）"""
+        if self._flags[node_id] & _FLAG_VALUE_CONTENT:
+            return _value_content(self.value(node_id))
+        return self._contents[node_id]
+
+    def trace_node(self, node_id):
+        return TraceNode(self.task(node_id), bool(self._flags[node_id] & _FLAG_FORMULA),
+                         self.content(node_id), self.value(node_id))
+
+    # --- 與 DependencyGraph 相同的建構介面 ---
+
+    def add_result(self, task, result):
+        """加入 trace_dependency_vine 的結果，返回 key"""
+        dependencies, is_formula, content, actual_value = result
+        formula_for_order = content if is_formula and isinstance(content, str) else None
+        node_id = self.intern(task)
+        self._set_result(node_id, is_formula, content, actual_value,
+                         sort_dependencies_by_formula_order(dependencies, formula_for_order))
+        return self.key(node_id)
+
+    def _set_result(self, node_id, is_formula, content, actual_value, children):
+        child_ids = [self.intern(child) for child in children]
+        flags = self._flags[node_id]
+        if not flags & _FLAG_TRACED:
+            self._traced_count += 1
+        flags = (flags & _FLAG_RANGE) | _FLAG_TRACED | (_FLAG_FORMULA if is_formula else 0)
+        self._other_values.pop(node_id, None)
+        if actual_value.__class__ is float:
+            self._numbers[node_id] = actual_value
+            flags |= _FLAG_NUMBER
+        elif actual_value.__class__ is int and -_MAX_EXACT_INT <= actual_value <= _MAX_EXACT_INT:
+            self._numbers[node_id] = actual_value
+            flags |= _FLAG_NUMBER | _FLAG_INTEGER
+        elif actual_value is not None:
+            self._other_values[node_id] = actual_value
+        if not is_formula and content == _value_content(actual_value):
+            content = None
+            flags |= _FLAG_VALUE_CONTENT
+        self._flags[node_id] = flags
+        self._contents[node_id] = content
+        self._offsets[node_id] = len(self._targets)
+        self._counts[node_id] = len(child_ids)
+        self._targets.extend(child_ids)
+        self._cyclic_nodes = None
+
+    def compact(self):
+        """建構完成後呼叫：儲存格查詢索引全部併入排序陣列，並移除重新 add_result 留下的邊空洞"""
+        if self._pending_cells:
+            self._merge_pending_cells()
+        targets = array('i')
+        for node_id in range(self.node_count):
+            offset = self._offsets[node_id]
+            self._offsets[node_id] = len(targets)
+            targets.extend(self._targets[offset:offset + self._counts[node_id]])
+        self._targets = targets
+
+    # --- 與 TraceResult 相同的走訪介面 ---
+
+    def __len__(self):
+        return self._traced_count
+
+    def __contains__(self, key):
+        node_id = self.node_id(key)
+        return node_id is not None and bool(self._flags[node_id] & _FLAG_TRACED)
+
+    def children(self, key):
+        node_id = self.node_id(key)
+        if node_id is None:
+            return []
+        return [self.task(child_id) for child_id in self.child_ids(node_id)]
+
+    def range_bounds(self, node_id):
+        """範圍節點涵蓋的 (min_row, min_col, max_row, max_col)，整欄 / 整列延伸到工作表邊界"""
+        min_row, max_row = self._min_rows[node_id] or 1, self._max_rows[node_id] or _EXCEL_MAX_ROW
+        min_col, max_col = self._min_cols[node_id] or 1, self._max_cols[node_id] or _EXCEL_MAX_COL
+        return min(min_row, max_row), min(min_col, max_col), max(min_row, max_row), max(min_col, max_col)
+
+    def _build_range_index(self):
+        index = RangeIntervalIndex()
+        range_nodes = {}
+        for node_id in range(self.node_count):
+            if self._flags[node_id] & _FLAG_RANGE:
+                slot = self._node_slots[node_id]
+                bounds = self.range_bounds(node_id)
+                index.add(slot, bounds)
+                range_nodes.setdefault((slot, bounds), []).append(node_id)
+        self._range_index = (index, range_nodes)
+
+    def ranges_containing(self, task_or_key):
+        """
+        包含指定儲存格的範圍節點 key（例如哪些 A1:A100000 / A:A 引用涵蓋 Sheet1!A5000）。
+        範圍本身就是節點，以每個工作表的區間索引查詢，不展開範圍內的儲存格；位址不是單一儲存格時返回空列表。
+        """
+        slot, _, bounds = self._locate(task_or_key, False)
+        if slot is None or bounds is None or bounds[4]:
+            return []
+        if self._range_index is None:
+            self._build_range_index()
+        index, range_nodes = self._range_index
+        found = []
+        for range_bounds in index.containing(slot, bounds[0], bounds[1]):
+            found.extend(self.key(node_id) for node_id in range_nodes[(slot, range_bounds)])
+        return found
+
+    def cyclic_ids(self):
+        """Tarjan 演算法（顯式堆疊）在整數陣列上找出位於循環中的節點 id"""
+        count = self.node_count
+        index_of = array('i', [-1]) * count
+        lowlink = array('i', [0]) * count
+        on_stack = bytearray(count)
+        flags, offsets, counts, targets = self._flags, self._offsets, self._counts, self._targets
+        stack = []
+        cyclic = set()
+        counter = 0
+        for start in range(count):
+            if index_of[start] != -1 or not flags[start] & _FLAG_TRACED:
+                continue
+            index_of[start] = lowlink[start] = counter
+            counter += 1
+            stack.append(start)
+            on_stack[start] = 1
+            work = [(start, offsets[start], offsets[start] + counts[start])]
+            while work:
+                node_id, position, end = work[-1]
+                descended = False
+                while position < end:
+                    child = targets[position]
+                    position += 1
+                    if not flags[child] & _FLAG_TRACED:
+                        continue
+                    if index_of[child] == -1:
+                        work[-1] = (node_id, position, end)
+                        index_of[child] = lowlink[child] = counter
+                        counter += 1
+                        stack.append(child)
+                        on_stack[child] = 1
+                        work.append((child, offsets[child], offsets[child] + counts[child]))
+                        descended = True
+                        break
+                    if on_stack[child] and index_of[child] < lowlink[node_id]:
+                        lowlink[node_id] = index_of[child]
+                if descended:
+                    continue
+
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    if lowlink[node_id] < lowlink[parent]:
+                        lowlink[parent] = lowlink[node_id]
+                if lowlink[node_id] == index_of[node_id]:
+                    member = stack.pop()
+                    on_stack[member] = 0
+                    if member != node_id:
+                        component = [member]
+                        while member != node_id:
+                            member = stack.pop()
+                            on_stack[member] = 0
+                            component.append(member)
+                        cyclic.update(component)
+                    elif node_id in self.child_ids(node_id):
+                        cyclic.add(node_id)
+        return cyclic
+
+    @property
+    def cyclic_nodes(self):
+        if self._cyclic_nodes is None:
+            self._cyclic_nodes = {self.key(node_id) for node_id in self.cyclic_ids()}
+        return self._cyclic_nodes
+
+    def reachable_ids(self):
+        """從所有根節點可到達的已追蹤節點 id，依第一次遇到的順序排列"""
+        seen = bytearray(self.node_count)
+        ordered = []
+        stack = list(reversed(self.roots.ids))
+        while stack:
+            node_id = stack.pop()
+            if seen[node_id] or not self._flags[node_id] & _FLAG_TRACED:
+                continue
+            seen[node_id] = 1
+            ordered.append(node_id)
+            children = self.child_ids(node_id)
+            for i in range(len(children) - 1, -1, -1):
+                if not seen[children[i]]:
+                    stack.append(children[i])
+        return ordered
+
+    def reachable_keys(self):
+        return [self.key(node_id) for node_id in self.reachable_ids()]
+
+    def to_dict(self):
+        """與 TraceResult.to_dict 相同的結構，直接以節點 id 計算邊與索引"""
+        ids = self.reachable_ids()
+        index_of = {node_id: i for i, node_id in enumerate(ids)}
+        nodes = []
+        edges = []
+        for i, node_id in enumerate(ids):
+            node = self.trace_node(node_id)
+            nodes.append({
+                "id": i,
+                "file": node.task["file"],
+                "sheet": node.task["sheet"],
+                "cell": node.task["cell"],
+                "kind": node.kind,
+                "formula": node.formula,
+                "value": node.actual_value,
+                "characteristic": node.characteristic,
+                "content": node.content,
+            })
+            for child_id in self.child_ids(node_id):
+                child_index = index_of.get(child_id)
+                if child_index is not None:
+                    edges.append([i, child_index])
+        return {
+            "roots": [index_of[node_id] for node_id in self.roots.ids if node_id in index_of],
+            "nodes": nodes,
+            "edges": edges,
+            "cycles": sorted(index_of[node_id] for node_id in self.cyclic_ids() if node_id in index_of),
+        }
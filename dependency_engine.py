@@ -0,0 +1,300 @@
+import os
+import re
+from functools import partial
+from openpyxl.worksheet.formula import ArrayFormula
+from openpyxl.utils.cell import get_column_letter
+from workbook_cache import FingerprintLRUCache
+from formula_extractor import extract_references, get_workbook_parts, external_book_path, split_cell_reference
+from sheet_store import get_sheet_store, set_sheet_store_cache_limit, cell_index
+from model_index import ModelCellIndex
+from range_summary import get_range_summary, set_range_digest_cache_file
+from dependency_graph import DependencyGraph, build_dependency_graph, build_dependency_graph_by_frontier
+from trace_result import TraceResult
+from trace_renderers import iter_text_lines
+
+# 依賴追蹤引擎：不依賴 tkinter / pywin32，可在背景行程（平行追蹤的 worker）或命令列中直接匯入。
+# formulas（編譯模型）與完整的 openpyxl 活頁簿載入只在備援路徑用到，第一次使用時才匯入。
+
+def trace_task(task, trace_function=None, working_path=None, dependency_graph=None, on_traced=None):
+    """追蹤單一任務，返回結構化的 TraceResult（不做任何輸出）；on_traced 見 build_dependency_graph"""
+    if trace_function is None:
+        trace_function = indexed_trace_dependency_vine
+    if working_path is None:
+        working_path = os.path.dirname(task["file"])
+    dependency_graph = build_dependency_graph(task, trace_function, working_path, dependency_graph, on_traced)
+    commit_dependency_index()
+    return TraceResult.from_graph(dependency_graph)
+
+def trace_tasks(tasks, trace_function=None, working_path=None, dependency_graph=None, frontier=False):
+    """
+    批次追蹤多個根任務（例如損益表的每一行），返回與 tasks 順序對應的 TraceResult 列表。
+    所有根共用同一個記憶化依賴圖與活頁簿快取，重疊的子樹只追蹤一次，
+    總成本接近追蹤所有根的聯集一次。
+    frontier=True 時改用廣度優先的分組追蹤，trace_function 須接受同一工作表的任務列表
+    （預設 indexed_trace_sheet_tasks）。
+    """
+    if dependency_graph is None:
+        dependency_graph = DependencyGraph()
+    if frontier:
+        if trace_function is None:
+            trace_function = indexed_trace_sheet_tasks
+        roots_by_working_path = {}
+        for task in tasks:
+            task_working_path = working_path if working_path is not None else os.path.dirname(task["file"])
+            roots_by_working_path.setdefault(task_working_path, []).append(task)
+        for task_working_path, root_tasks in roots_by_working_path.items():
+            build_dependency_graph_by_frontier(root_tasks, trace_function, task_working_path, dependency_graph)
+    else:
+        if trace_function is None:
+            trace_function = indexed_trace_dependency_vine
+        for task in tasks:
+            task_working_path = working_path if working_path is not None else os.path.dirname(task["file"])
+            build_dependency_graph(task, trace_function, task_working_path, dependency_graph)
+    commit_dependency_index()
+    combined_result = TraceResult.from_graph(dependency_graph)
+    return [combined_result.for_root(task) for task in tasks]
+
+def expand_range(task, stored_only=False):
+    """
+    範圍任務（例如 ranges_containing 找到的範圍節點）內的儲存格任務，依列優先順序逐一產生，
+    可再交給 trace_tasks 按需追蹤。整欄 / 整列以工作表已使用範圍為界；
+    stored_only 時略過沒有公式也沒有值的儲存格。
+    """
+    workbook_parts = get_workbook_parts(task["file"])
+    actual_sheet_name = workbook_parts.resolve_sheet_name(task["sheet"])
+    if not actual_sheet_name:
+        raise ValueError(f"Worksheet '{task['sheet']}' does not exist.")
+    sheet_store = get_sheet_store(task["file"], actual_sheet_name)
+    min_row, min_col, max_row, max_col = sheet_store.range_bounds(task["cell"])
+    min_row, max_row = min(min_row, max_row), max(min_row, max_row)
+    min_col, max_col = min(min_col, max_col), max(min_col, max_col)
+    formulas, values = sheet_store.formulas, sheet_store.values
+    for row in range(min_row, max_row + 1):
+        for col in range(min_col, max_col + 1):
+            if stored_only:
+                index = cell_index(row, col)
+                if index not in formulas and index not in values:
+                    continue
+            yield {"file": task["file"], "sheet": actual_sheet_name, "cell": f"{get_column_letter(col)}{row}"}
+
+def process_task_recursively(
+    task,
+    prefix="",
+    current_path=None,
+    parent_context=None,
+    unique_nodes_for_report=None,
+    final_dependency_map=None,
+    trace_dependency_vine=None,
+    working_path=None,
+    display_mode="simple",
+    dependency_graph=None
+):
+    # 先建立記憶化依賴圖（每個儲存格只追蹤一次），再由文字輸出器印出樹狀結構
+    # current_path 僅為相容舊呼叫方式而保留，循環偵測由 TraceResult.walk 負責
+    result = trace_task(task, trace_dependency_vine, working_path, dependency_graph)
+
+    for line, line_kind, entry in iter_text_lines(result, task, display_mode, prefix, parent_context):
+        if unique_nodes_for_report is not None and line_kind != "circular" and entry.key not in unique_nodes_for_report:
+            unique_nodes_for_report.add(entry.key)
+            if final_dependency_map is not None:
+                final_dependency_map.append(entry.task)
+        print(line)
+    return result
+
+# formulas 模型快取：同一檔案只編譯一次，三種 workbook 載入模式共用
+# 以檔案大小乘上倍數估算模型佔用的記憶體，超過上限時以 LRU 淘汰
+MODEL_CACHE_MAX_BYTES = 2 * 1024 ** 3
+MODEL_SIZE_FACTOR = 20
+
+_model_cache = FingerprintLRUCache(
+    MODEL_CACHE_MAX_BYTES,
+    size_estimator=lambda file_path, model_index: os.path.getsize(file_path) * MODEL_SIZE_FACTOR
+)
+
+def _load_model_index(file_path):
+    import formulas
+    return ModelCellIndex(formulas.ExcelModel().load(file_path))
+
+def get_cached_model_index(file_path):
+    """獲取快取的模型索引（模型與儲存格索引一起建立），檔案修改時間或大小改變時自動重新編譯"""
+    return _model_cache.get(file_path, file_path, lambda: _load_model_index(file_path))
+
+# 範圍摘要的磁碟快取：設定環境變數 EXCEL_SCANNER_RANGE_DIGEST_CACHE 為 JSON 檔路徑即可跨工作階段重用
+RANGE_DIGEST_CACHE_FILE = os.environ.get("EXCEL_SCANNER_RANGE_DIGEST_CACHE")
+if RANGE_DIGEST_CACHE_FILE:
+    set_range_digest_cache_file(RANGE_DIGEST_CACHE_FILE)
+
+# 工作表資料快取的記憶體上限：設定環境變數 EXCEL_SCANNER_SHEET_CACHE_MB 為 MB 數即可調整，
+# 環境變數會傳給平行追蹤的子行程，各行程的快取套用同一上限
+SHEET_CACHE_LIMIT_MB = os.environ.get("EXCEL_SCANNER_SHEET_CACHE_MB")
+if SHEET_CACHE_LIMIT_MB:
+    set_sheet_store_cache_limit(int(SHEET_CACHE_LIMIT_MB) * 1024 ** 2)
+
+# SQLite 依賴索引：設定環境變數 EXCEL_SCANNER_DEPENDENCY_INDEX 為資料庫路徑即可啟用，
+# 未變更的活頁簿直接以索引查詢取得追蹤結果，不必重新解析
+DEPENDENCY_INDEX_FILE = os.environ.get("EXCEL_SCANNER_DEPENDENCY_INDEX")
+_dependency_index = None
+if DEPENDENCY_INDEX_FILE:
+    from dependency_index import DependencyIndex
+    _dependency_index = DependencyIndex(DEPENDENCY_INDEX_FILE)
+
+def commit_dependency_index():
+    """把本次追蹤寫入依賴索引的結果提交到資料庫（未啟用索引時不做任何事）"""
+    if _dependency_index is not None:
+        _dependency_index.commit()
+
+def indexed_trace_dependency_vine(task, working_path):
+    """有啟用依賴索引時經由索引追蹤，否則直接呼叫 trace_dependency_vine"""
+    if _dependency_index is None:
+        return trace_dependency_vine(task, working_path)
+    return _dependency_index.trace(task, working_path, trace_dependency_vine)
+
+def indexed_trace_sheet_tasks(tasks, working_path, sheet_store=None):
+    """分組版本的 indexed_trace_dependency_vine（同一工作表的多個任務）；sheet_store 見 trace_sheet_tasks"""
+    trace = trace_sheet_tasks if sheet_store is None else partial(trace_sheet_tasks, sheet_store=sheet_store)
+    if _dependency_index is None:
+        return trace(tasks, working_path)
+    return _dependency_index.trace_group(tasks, working_path, trace)
+
+def _references_from_model(target_file_path, actual_sheet_name, target_cell_address, working_path):
+    """以 formulas 模型的 inputs 取得引用（formula_extractor 無法解析公式時的備援）"""
+    model_index = get_cached_model_index(target_file_path)
+    compiled_cell_object = model_index.lookup(target_file_path, actual_sheet_name, target_cell_address)
+
+    normalized_parts = []
+    if compiled_cell_object and hasattr(compiled_cell_object, 'inputs') and compiled_cell_object.inputs:
+        ref_pattern = re.compile(r"'(.*)\[(.*?)\](.*?)'!(.*)")
+        for ref in compiled_cell_object.inputs.keys():
+            if match := ref_pattern.match(ref):
+                _, filename_part, sheetname_part, cell_address_part = match.groups()
+                absolute_path = os.path.join(working_path, filename_part)
+                part = {"file": absolute_path, "sheet": sheetname_part, "cell": cell_address_part}
+            else:
+                sheetname_part, cell_address_part = ref.split('!')
+                part = {"file": target_file_path, "sheet": sheetname_part.strip("'"), "cell": cell_address_part}
+            normalized_parts.append(part)
+    return normalized_parts
+
+def trace_dependency_vine(task, working_path):
+    return trace_sheet_tasks([task], working_path)[0]
+
+def trace_sheet_tasks(tasks, working_path, sheet_store=None):
+    """
+    追蹤同一 (檔案, 工作表) 的多個任務，返回與 tasks 順序對應的結果列表。
+    活頁簿結構、工作表名稱與工作表資料每組只解析 / 查詢一次，不再逐一儲存格重複處理。
+    傳入 sheet_store 時直接使用（例如只含部分儲存格的 SheetStore），不從快取載入工作表。
+    """
+    target_file_path, target_sheet_name = tasks[0]["file"], tasks[0]["sheet"]
+    # 工作表 XML 只解析一次，同時提供公式、快取值與解析外部連結後的公式，
+    # 不再分別載入 data_only=False / data_only=True / resolved 三份 workbook
+    try:
+        workbook_parts = get_workbook_parts(target_file_path)
+    except Exception as e:
+        print(f"Warning: Could not load {target_file_path}: {e}")
+        return [([], False, f"❌ Could not load file: {target_file_path}", None) for _ in tasks]
+
+    actual_sheet_name = workbook_parts.resolve_sheet_name(target_sheet_name)
+    if not actual_sheet_name:
+        error = f"❌ Error during analysis: Worksheet '{target_sheet_name}' does not exist."
+        return [([], False, error, None) for _ in tasks]
+
+    sheet_store = None
+    results = []
+    for task in tasks:
+        try:
+            if ":" in task["cell"]:
+                display_content = get_range_summary(target_file_path, actual_sheet_name, task["cell"])
+                results.append(([], False, display_content, None))
+                continue
+            if sheet_store is None:
+                sheet_store = get_sheet_store(target_file_path, actual_sheet_name)
+            results.append(_trace_cell(task, working_path, workbook_parts, actual_sheet_name, sheet_store))
+        except Exception as e:
+            results.append(([], False, f"❌ Error during analysis: {e}", None))
+    return results
+
+def _trace_cell(task, working_path, workbook_parts, actual_sheet_name, sheet_store):
+    """追蹤單一儲存格（工作表已解析），返回 (引用, 是否公式, 顯示內容, 實際值)"""
+    target_file_path, target_cell_address = task["file"], task["cell"]
+    cell_row, cell_col = split_cell_reference(target_cell_address)
+    cell_content = sheet_store.content(cell_row, cell_col)
+    is_formula = isinstance(cell_content, ArrayFormula) or (isinstance(cell_content, str) and cell_content.startswith('='))
+    
+    if not is_formula:
+        if isinstance(cell_content, str):
+            display_content = f"'{cell_content}'"
+        else:
+            display_content = str(cell_content)
+    else:
+        display_content = str(cell_content)
+
+    normalized_parts = []
+
+    if is_formula:
+        raw_formula = str(cell_content.text) if isinstance(cell_content, ArrayFormula) else str(cell_content)
+        reconstructed_formula = raw_formula
+
+        # 直接 tokenize 公式找出引用（R1C1 相對形式相同的公式只 tokenize 一次）；tokenizer 無法處理時才退回編譯 formulas 模型
+        try:
+            normalized_parts = extract_references(raw_formula, target_file_path, actual_sheet_name, working_path,
+                                                  origin=(cell_row, cell_col))
+        except Exception:
+            normalized_parts = _references_from_model(target_file_path, actual_sheet_name, target_cell_address, working_path)
+
+        external_books = workbook_parts.external_books
+        if external_books:
+            index_to_path_map = {
+                int(index): external_book_path(target, working_path)
+                for index, target in external_books.items()
+            }
+
+            def replacer(match):
+                placeholder_index = int(match.group(1))
+                formula_part = match.group(2)
+                full_path = index_to_path_map.get(placeholder_index)
+                if not full_path:
+                    return match.group(0)
+                if '!' in formula_part:
+                    sheet_name, cell_ref = formula_part.split('!', 1)
+                    return f"'{os.path.dirname(full_path)}\\[{os.path.basename(full_path)}]{sheet_name}'!{cell_ref}"
+                else:
+                    return f"'{os.path.dirname(full_path)}\\[{os.path.basename(full_path)}]{formula_part}'"
+
+            reconstructed_formula = re.sub(r'\[(\d+)\]([^\]!]+(?:![\$A-Z0-9:]+)?)(?=[,)\s*+\-\/\^=<>:&]|$)', replacer, raw_formula)
+
+        # 解析外部連結後的公式已在載入工作表時一併記錄；陣列公式沿用重建的公式
+        if isinstance(cell_content, ArrayFormula):
+            display_content = reconstructed_formula
+        else:
+            display_content = sheet_store.display_formula(cell_row, cell_col)
+        
+        if "INDIRECT" in raw_formula.upper():
+            try:
+                match = re.search(r'INDIRECT\((.*)\)', raw_formula, re.IGNORECASE)
+                if match:
+                    argument_str = match.group(1)
+                    literals = re.findall(r'"(.*?)"', argument_str)
+                    cell_refs = [ref for ref in re.split(r'"[^"]*"|&', argument_str) if ref]
+
+                    evaluated_refs = [str(sheet_store.cached_value(*split_cell_reference(cell.strip()))) for cell in cell_refs]
+                    
+                    final_target_str = ""
+                    if len(literals) == 3 and len(evaluated_refs) == 2:
+                            final_target_str = literals[0] + literals[1] + evaluated_refs[0] + literals[2] + evaluated_refs[1]
+                    
+                    if final_target_str:
+                        ref_match = re.search(r"'?(.*\\\[(.*?)\])(.*?)'?!([A-Z0-9]+)", final_target_str, re.IGNORECASE)
+                        if ref_match:
+                            full_path_part, filename, sheet, cell = ref_match.groups()
+                            dep_filepath = os.path.join(os.path.dirname(full_path_part), filename)
+                            new_task = {"file": dep_filepath, "sheet": sheet, "cell": cell}
+                            normalized_parts.insert(0, new_task)
+                        else:
+                            display_content += f" [Tracer Warning: Could not parse INDIRECT result '{final_target_str}']"
+            except Exception as e:
+                display_content += f" [Tracer Warning: Could not resolve INDIRECT -> {e}]"
+
+    # 實際的儲存格值（工作表 XML 中的快取值 <v>，用於顯示）
+    actual_value = sheet_store.cached_value(cell_row, cell_col)
+    
+    return normalized_parts, is_formula, display_content, actual_value
@@ -0,0 +1,193 @@
+import os
+
+
+def node_key(task):
+    """節點識別：檔案路徑依作業系統規則、工作表名稱不分大小寫、位址大寫"""
+    return (os.path.normcase(task["file"]), task["sheet"].lower(), task["cell"].replace("$", "").upper())
+
+
+def sort_dependencies_by_formula_order(dependencies, formula):
+    """依引用在公式中出現的位置排序依賴，讓樹狀輸出與公式閱讀順序一致"""
+    if not formula or not isinstance(formula, str) or not dependencies:
+        return dependencies
+    formula_upper = formula.upper()
+    dep_positions = []
+    for dep in dependencies:
+        dep_cell = dep.get("cell", "")
+        dep_sheet = dep.get("sheet", "")
+        # 純文字搜尋：每個依賴的樣式都不同，逐一編譯正規表示式會讓整本掃描時的合併成為瓶頸
+        patterns = [
+            dep_cell,
+            f"{dep_sheet}!{dep_cell}",
+            f"'{dep_sheet}'!{dep_cell}"
+        ]
+        min_pos = len(formula_upper)+1
+        for pat in patterns:
+            pos = formula_upper.find(pat)
+            if pos != -1:
+                min_pos = min(min_pos, pos)
+        dep_positions.append((min_pos, dep))
+    dep_positions.sort(key=lambda x: x[0])
+    return [d for pos, d in dep_positions]
+
+
+class DependencyGraph:
+    """
+    記憶化依賴圖：每個儲存格只呼叫一次 trace_dependency_vine。
+    results 保存追蹤結果 (dependencies, is_formula, content, actual_value)，
+    edges 保存依公式順序排列的子任務，樹狀輸出直接從圖重建。
+    """
+
+    def __init__(self):
+        self.tasks = {}     # key -> 第一次遇到的任務
+        self.results = {}   # key -> trace_dependency_vine 的返回值
+        self.edges = {}     # key -> 依公式順序排列的子任務列表
+        self.roots = []
+        self._cyclic_nodes = None
+
+    def __contains__(self, key):
+        return key in self.results
+
+    def __len__(self):
+        return len(self.results)
+
+    def children(self, key):
+        return self.edges.get(key, [])
+
+    def add_result(self, task, result):
+        key = node_key(task)
+        self.tasks.setdefault(key, task)
+        self.results[key] = result
+        dependencies, is_formula, content, _ = result
+        formula_for_order = content if is_formula and isinstance(content, str) else None
+        self.edges[key] = sort_dependencies_by_formula_order(dependencies, formula_for_order)
+        self._cyclic_nodes = None
+        return key
+
+    def strongly_connected_components(self):
+        """
+        Tarjan 演算法找出強連通分量。
+        以顯式堆疊實作，數千層深的引用鏈也不會觸發 RecursionError。
+        """
+        index_of = {}
+        lowlink = {}
+        on_stack = set()
+        stack = []
+        components = []
+        counter = 0
+
+        for start_key in self.results:
+            if start_key in index_of:
+                continue
+            index_of[start_key] = lowlink[start_key] = counter
+            counter += 1
+            stack.append(start_key)
+            on_stack.add(start_key)
+            work = [(start_key, iter(self.children(start_key)))]
+            while work:
+                key, child_iter = work[-1]
+                descended = False
+                for child in child_iter:
+                    child_key = node_key(child)
+                    if child_key not in self.results:
+                        continue
+                    if child_key not in index_of:
+                        index_of[child_key] = lowlink[child_key] = counter
+                        counter += 1
+                        stack.append(child_key)
+                        on_stack.add(child_key)
+                        work.append((child_key, iter(self.children(child_key))))
+                        descended = True
+                        break
+                    if child_key in on_stack:
+                        lowlink[key] = min(lowlink[key], index_of[child_key])
+                if descended:
+                    continue
+
+                work.pop()
+                if work:
+                    parent_key = work[-1][0]
+                    lowlink[parent_key] = min(lowlink[parent_key], lowlink[key])
+                if lowlink[key] == index_of[key]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == key:
+                            break
+                    components.append(component)
+        return components
+
+    @property
+    def cyclic_nodes(self):
+        """位於循環中的節點（大小超過 1 的強連通分量，或自我引用）"""
+        if self._cyclic_nodes is None:
+            cyclic = set()
+            for component in self.strongly_connected_components():
+                if len(component) > 1:
+                    cyclic.update(component)
+                else:
+                    key = component[0]
+                    if any(node_key(child) == key for child in self.children(key)):
+                        cyclic.add(key)
+            self._cyclic_nodes = cyclic
+        return self._cyclic_nodes
+
+
+def build_dependency_graph(root_task, trace_dependency_vine, working_path, graph=None, on_traced=None):
+    """
+    從 root_task 出發建立依賴圖，每個唯一節點只追蹤一次。
+    追蹤成本與唯一儲存格數量成正比，不再隨共用子樹的路徑數量指數增長。
+    on_traced(graph, task) 在每個節點追蹤後呼叫，可用來回報進度；在其中拋出例外即可中止追蹤。
+    """
+    if graph is None:
+        graph = DependencyGraph()
+    root_key = node_key(root_task)
+    if root_key not in graph.roots:
+        graph.roots.append(root_key)
+
+    pending = [root_task]
+    while pending:
+        task = pending.pop()
+        key = node_key(task)
+        if key in graph.results:
+            continue
+        graph.add_result(task, trace_dependency_vine(task, working_path))
+        if on_traced is not None:
+            on_traced(graph, task)
+        for child in reversed(graph.children(key)):
+            if node_key(child) not in graph.results:
+                pending.append(child)
+    return graph
+
+
+def build_dependency_graph_by_frontier(root_tasks, trace_sheet_tasks, working_path, graph=None):
+    """
+    廣度優先的分組追蹤：每一層待追蹤的任務依 (檔案, 工作表) 分組，
+    同一組以 trace_sheet_tasks(tasks, working_path) 一次處理，結果的子任務組成下一層。
+    同一活頁簿的各組連續處理，跨多本連結活頁簿時不必逐一儲存格來回切換檔案。
+    """
+    if graph is None:
+        graph = DependencyGraph()
+    for root_task in root_tasks:
+        root_key = node_key(root_task)
+        if root_key not in graph.roots:
+            graph.roots.append(root_key)
+
+    frontier = list(root_tasks)
+    while frontier:
+        groups = {}
+        for task in frontier:
+            key = node_key(task)
+            if key not in graph.results:
+                groups.setdefault(key[:2], {}).setdefault(key, task)
+
+        next_frontier = []
+        for group_key in sorted(groups, key=lambda group_key: group_key[0]):
+            tasks = list(groups[group_key].values())
+            for task, result in zip(tasks, trace_sheet_tasks(tasks, working_path)):
+                key = graph.add_result(task, result)
+                next_frontier.extend(child for child in graph.children(key) if node_key(child) not in graph.results)
+        frontier = next_frontier
+    return graph
@@ -0,0 +1,280 @@
+import os
+import json
+import sqlite3
+import zipfile
+import hashlib
+import datetime
+import threading
+
+from workbook_cache import get_file_fingerprint
+from formula_extractor import get_workbook_parts
+
+# 本機 SQLite 依賴索引：保存 trace_dependency_vine 的結果（引用邊、公式 / 內容、快取值），
+# 以活頁簿內容雜湊與 (mtime, size) 判斷是否過期，只重新索引內容有變更的工作表。
+
+INDEX_SCHEMA_VERSION = 1
+
+_IGNORED_PART_PREFIXES = ("docProps/", "xl/calcChain.xml")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS workbooks (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER,
+    size INTEGER,
+    content_hash TEXT,
+    shared_hash TEXT
+);
+CREATE TABLE IF NOT EXISTS sheets (
+    path TEXT,
+    sheet TEXT,
+    sheet_hash TEXT,
+    PRIMARY KEY (path, sheet)
+);
+CREATE TABLE IF NOT EXISTS cells (
+    path TEXT,
+    sheet TEXT,
+    cell TEXT,
+    working_path TEXT,
+    is_formula INTEGER,
+    content TEXT,
+    actual_value TEXT,
+    PRIMARY KEY (path, sheet, cell, working_path)
+);
+CREATE TABLE IF NOT EXISTS edges (
+    path TEXT,
+    sheet TEXT,
+    cell TEXT,
+    working_path TEXT,
+    position INTEGER,
+    dep_file TEXT,
+    dep_sheet TEXT,
+    dep_cell TEXT
+);
+CREATE INDEX IF NOT EXISTS edges_by_cell ON edges (path, sheet, cell, working_path);
+"""
+
+
+def _encode_value(value):
+    """把儲存格值序列化為 JSON，保留 datetime / timedelta 型別"""
+    if isinstance(value, datetime.datetime):
+        return json.dumps({"datetime": value.isoformat()})
+    if isinstance(value, datetime.date):
+        return json.dumps({"date": value.isoformat()})
+    if isinstance(value, datetime.time):
+        return json.dumps({"time": value.isoformat()})
+    if isinstance(value, datetime.timedelta):
+        return json.dumps({"timedelta": value.total_seconds()})
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return json.dumps(value)
+    return json.dumps(str(value))
+
+
+def _decode_value(text):
+    value = json.loads(text)
+    if isinstance(value, dict):
+        if "datetime" in value:
+            return datetime.datetime.fromisoformat(value["datetime"])
+        if "date" in value:
+            return datetime.date.fromisoformat(value["date"])
+        if "time" in value:
+            return datetime.time.fromisoformat(value["time"])
+        if "timedelta" in value:
+            return datetime.timedelta(seconds=value["timedelta"])
+    return value
+
+
+def _workbook_hashes(file_path):
+    """
+    以 zip 內各部件的 CRC32 與大小計算雜湊，不需解壓縮。
+    返回 (整本內容雜湊, 共用部件雜湊, {工作表小寫: 工作表部件雜湊})；
+    共用部件（workbook.xml、sharedStrings、styles、外部連結等）變更時所有工作表都需重新索引。
+    """
+    parts = get_workbook_parts(file_path)
+    sheet_part_names = {part_path: sheet_lower for sheet_lower, (_, part_path) in parts.sheet_parts.items()}
+    content = hashlib.sha256()
+    shared = hashlib.sha256()
+    sheet_hashes = {}
+    with zipfile.ZipFile(file_path) as zf:
+        for info in sorted(zf.infolist(), key=lambda i: i.filename):
+            signature = f"{info.filename}:{info.CRC:08x}:{info.file_size};"
+            content.update(signature.encode('utf-8'))
+            sheet_lower = sheet_part_names.get(info.filename)
+            if sheet_lower is None:
+                # 文件屬性與計算鏈每次儲存都會變，但不影響追蹤結果
+                if info.filename.startswith(_IGNORED_PART_PREFIXES):
+                    continue
+                shared.update(signature.encode('utf-8'))
+            else:
+                sheet_hashes[sheet_lower] = signature
+    return content.hexdigest(), shared.hexdigest(), sheet_hashes
+
+
+class DependencyIndex:
+    """
+    SQLite 依賴索引。trace() 包裝 trace_dependency_vine：
+    檔案未變更時直接以索引查詢返回結果，否則追蹤後寫入索引。
+    每個檔案在 (mtime, size) 改變時才重新比對內容雜湊，只清除有變更的工作表。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._validated = {}  # path -> 已驗證的 (mtime, size) 指紋
+        with self._lock:
+            self._connection.executescript(_SCHEMA)
+            row = self._connection.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+            if row is None or int(row[0]) != INDEX_SCHEMA_VERSION:
+                for table in ("workbooks", "sheets", "cells", "edges"):
+                    self._connection.execute(f"DELETE FROM {table}")
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)",
+                    (str(INDEX_SCHEMA_VERSION),)
+                )
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _delete_sheet(self, path, sheet):
+        self._connection.execute("DELETE FROM cells WHERE path = ? AND sheet = ?", (path, sheet))
+        self._connection.execute("DELETE FROM edges WHERE path = ? AND sheet = ?", (path, sheet))
+        self._connection.execute("DELETE FROM sheets WHERE path = ? AND sheet = ?", (path, sheet))
+
+    def _delete_workbook(self, path):
+        for table in ("cells", "edges", "sheets", "workbooks"):
+            self._connection.execute(f"DELETE FROM {table} WHERE path = ?", (path,))
+
+    def validate(self, file_path):
+        """
+        確認索引中此檔案的資料仍有效；檔案變更時只刪除內容有變更的工作表。
+        返回 False 表示檔案無法讀取（此時不使用索引）。
+        """
+        path = os.path.normcase(file_path)
+        fingerprint = get_file_fingerprint(file_path)
+        if fingerprint is None:
+            return False
+        if self._validated.get(path) == fingerprint:
+            return True
+
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT mtime_ns, size, content_hash, shared_hash FROM workbooks WHERE path = ?", (path,)
+            ).fetchone()
+            if row is not None and (row[0], row[1]) == fingerprint:
+                self._validated[path] = fingerprint
+                return True
+
+            try:
+                content_hash, shared_hash, sheet_hashes = _workbook_hashes(file_path)
+            except Exception:
+                return False
+
+            if row is None or row[3] != shared_hash:
+                self._delete_workbook(path)
+            elif row[2] != content_hash:
+                stored = dict(self._connection.execute(
+                    "SELECT sheet, sheet_hash FROM sheets WHERE path = ?", (path,)
+                ).fetchall())
+                for sheet, sheet_hash in stored.items():
+                    if sheet_hashes.get(sheet) != sheet_hash:
+                        self._delete_sheet(path, sheet)
+
+            self._connection.execute(
+                "INSERT OR REPLACE INTO workbooks (path, mtime_ns, size, content_hash, shared_hash) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (path, fingerprint[0], fingerprint[1], content_hash, shared_hash)
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO sheets (path, sheet, sheet_hash) VALUES (?, ?, ?)",
+                [(path, sheet, sheet_hash) for sheet, sheet_hash in sheet_hashes.items()]
+            )
+            self._connection.commit()
+            self._validated[path] = fingerprint
+        return True
+
+    def lookup(self, task, working_path):
+        """返回索引中的 (dependencies, is_formula, content, actual_value)；不存在時返回 None"""
+        key = (os.path.normcase(task["file"]), task["sheet"].lower(),
+               task["cell"].replace("$", "").upper(), os.path.normcase(working_path))
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT is_formula, content, actual_value FROM cells "
+                "WHERE path = ? AND sheet = ? AND cell = ? AND working_path = ?", key
+            ).fetchone()
+            if row is None:
+                return None
+            edges = self._connection.execute(
+                "SELECT dep_file, dep_sheet, dep_cell FROM edges "
+                "WHERE path = ? AND sheet = ? AND cell = ? AND working_path = ? ORDER BY position", key
+            ).fetchall()
+        dependencies = [{"file": f, "sheet": s, "cell": c} for f, s, c in edges]
+        return dependencies, bool(row[0]), _decode_value(row[1]), _decode_value(row[2])
+
+    def store(self, task, working_path, result):
+        dependencies, is_formula, content, actual_value = result
+        key = (os.path.normcase(task["file"]), task["sheet"].lower(),
+               task["cell"].replace("$", "").upper(), os.path.normcase(working_path))
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO cells "
+                "(path, sheet, cell, working_path, is_formula, content, actual_value) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                key + (int(bool(is_formula)), _encode_value(content), _encode_value(actual_value))
+            )
+            self._connection.execute(
+                "DELETE FROM edges WHERE path = ? AND sheet = ? AND cell = ? AND working_path = ?", key
+            )
+            self._connection.executemany(
+                "INSERT INTO edges (path, sheet, cell, working_path, position, dep_file, dep_sheet, dep_cell) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [key + (position, dep["file"], dep["sheet"], dep["cell"]) for position, dep in enumerate(dependencies)]
+            )
+
+    def commit(self):
+        with self._lock:
+            self._connection.commit()
+
+    def trace(self, task, working_path, trace_function):
+        """
+        以索引取代重新解析：命中時為純查詢；未命中時呼叫 trace_function 並寫入索引。
+        錯誤結果（❌ 開頭）不寫入，下次仍會重新追蹤。
+        """
+        if not self.validate(task["file"]):
+            return trace_function(task, working_path)
+        cached = self.lookup(task, working_path)
+        if cached is not None:
+            return cached
+        result = trace_function(task, working_path)
+        content = result[2]
+        if not (isinstance(content, str) and content.startswith("❌")):
+            self.store(task, working_path, result)
+        return result
+
+    def trace_group(self, tasks, working_path, trace_sheet_tasks):
+        """
+        同一 (檔案, 工作表) 的多個任務：索引命中的直接返回，其餘一次交給 trace_sheet_tasks 追蹤後寫入索引。
+        """
+        if not self.validate(tasks[0]["file"]):
+            return trace_sheet_tasks(tasks, working_path)
+        results = [self.lookup(task, working_path) for task in tasks]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            traced = trace_sheet_tasks([tasks[i] for i in missing], working_path)
+            for i, result in zip(missing, traced):
+                results[i] = result
+                content = result[2]
+                if not (isinstance(content, str) and content.startswith("❌")):
+                    self.store(tasks[i], working_path, result)
+        return results
+
+    def clear(self):
+        with self._lock:
+            for table in ("workbooks", "sheets", "cells", "edges"):
+                self._connection.execute(f"DELETE FROM {table}")
+            self._connection.commit()
+            self._validated.clear()
@@ -0,0 +1,468 @@
+import os
+import re
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+from openpyxl.formula.tokenizer import Tokenizer, Token
+from openpyxl.utils.cell import coordinate_from_string, column_index_from_string, get_column_letter
+from openpyxl.utils.datetime import CALENDAR_WINDOWS_1900, CALENDAR_MAC_1904
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+
+from workbook_cache import FingerprintLRUCache
+
+# 不經 formulas.ExcelModel 編譯整本活頁簿，直接從 xlsx 壓縮檔串流讀取所需工作表的公式，
+# 以 tokenizer 找出引用，輸出與 trace_dependency_vine 相同的 {"file","sheet","cell"} 任務。
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+DOC_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+_TAG_SHEET_DATA = f"{{{MAIN_NS}}}sheetData"
+_TAG_ROW = f"{{{MAIN_NS}}}row"
+_TAG_CELL = f"{{{MAIN_NS}}}c"
+_TAG_FORMULA = f"{{{MAIN_NS}}}f"
+_TAG_VALUE = f"{{{MAIN_NS}}}v"
+_TAG_INLINE_STRING = f"{{{MAIN_NS}}}is"
+_TAG_TEXT = f"{{{MAIN_NS}}}t"
+
+_ADDRESS_PATTERN = (
+    r"\$?[A-Za-z]{1,3}\$?\d+(?::\$?[A-Za-z]{1,3}\$?\d+)?"  # A1 / A1:B2
+    r"|\$?[A-Za-z]{1,3}:\$?[A-Za-z]{1,3}"                  # A:B
+    r"|\$?\d+:\$?\d+"                                       # 1:3
+)
+_REF_OPERAND_RE = re.compile(r"^(?:(?P<prefix>'(?:[^']|'')+'|[^'!]+)!)?(?P<address>" + _ADDRESS_PATTERN + r")$")
+_BOOK_PREFIX_RE = re.compile(r"^(?P<path>.*?)\[(?P<book>[^\]]+)\](?P<sheet>.*)$")
+_MAX_NAME_DEPTH = 5
+
+# 公式中的 A1 引用（字串、加引號的工作表名稱與方括號內容原樣保留），用來把公式轉成 R1C1 相對形式：
+# 向下複製的整塊公式轉換後完全相同，只需 tokenize 一次，其他儲存格依位移還原引用。
+# 方括號包含表格結構化引用（Sales[FY2024]、Sales[[#This Row],[Q1]]）與外部活頁簿索引 [1]，其中的文字不是儲存格位址
+_RELATIVE_REF_RE = re.compile(
+    r"(?P<literal>\"(?:[^\"]|\"\")*\"|'(?:[^']|'')*'|\[(?:[^\[\]]|\[[^\[\]]*\])*\])"
+    r"|(?<![\w.$])(?P<col1>\$?[A-Za-z]{1,3}):(?P<col2>\$?[A-Za-z]{1,3})(?![\w.(!\[])"  # A:B
+    r"|(?<![\w.$])(?P<row1>\$?\d+):(?P<row2>\$?\d+)(?![\w.(!\[])"                       # 1:3
+    r"|(?<![\w.$])(?P<col_abs>\$?)(?P<letters>[A-Za-z]{1,3})(?P<row_abs>\$?)(?P<digits>\d+)(?![\w.(!\[])"  # A1 / $A$1
+)
+_MAX_ROW = 1048576
+_MAX_COL = 16384
+
+WORKBOOK_PARTS_CACHE_SIZE = 64
+RELATIVE_FORMULA_CACHE_SIZE = 4096
+
+
+class WorkbookParts:
+    """xlsx 內部結構摘要：工作表名稱與 XML 路徑、外部連結、定義名稱、日期樣式"""
+
+    def __init__(self, sheet_names, sheet_parts, external_books, defined_names,
+                 shared_strings_part=None, date_style_ids=frozenset(), timedelta_style_ids=frozenset(), epoch=CALENDAR_WINDOWS_1900):
+        self.sheet_names = sheet_names                  # 依活頁簿順序排列的工作表名稱
+        self.sheet_parts = sheet_parts                  # 小寫名稱 -> (實際名稱, XML 路徑)
+        self.external_books = external_books            # "1" -> 外部檔案目標路徑
+        self.defined_names = defined_names              # (小寫名稱, 工作表索引或 None) -> 定義內容
+        self.shared_strings_part = shared_strings_part  # xl/sharedStrings.xml 路徑
+        self.date_style_ids = date_style_ids            # 套用日期格式的 cellXfs 索引
+        self.timedelta_style_ids = timedelta_style_ids  # 套用 [h]:mm 類時間長度格式的 cellXfs 索引
+        self.epoch = epoch
+
+    def resolve_sheet_name(self, sheet_name):
+        entry = self.sheet_parts.get(sheet_name.lower())
+        return entry[0] if entry else None
+
+
+def _read_relationships(zf, rels_path):
+    """讀取 .rels 檔案，返回 Id -> (Target, TargetMode, Type)"""
+    try:
+        root = ET.fromstring(zf.read(rels_path))
+    except KeyError:
+        return {}
+    return {
+        rel.get("Id"): (rel.get("Target"), rel.get("TargetMode"), rel.get("Type"))
+        for rel in root.iter(f"{{{PKG_REL_NS}}}Relationship")
+    }
+
+
+def _resolve_part_path(base_dir, target):
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(base_dir, target))
+
+
+def _rels_path_for(part_path):
+    part_dir, part_name = posixpath.split(part_path)
+    return posixpath.join(part_dir, "_rels", f"{part_name}.rels")
+
+
+def _read_workbook_parts(file_path):
+    with zipfile.ZipFile(file_path) as zf:
+        workbook_part = "xl/workbook.xml"
+        for target, _, _ in _read_relationships(zf, "_rels/.rels").values():
+            if target and target.lstrip("/").endswith("workbook.xml"):
+                workbook_part = target.lstrip("/")
+                break
+        workbook_dir = posixpath.dirname(workbook_part)
+        workbook_rels = _read_relationships(zf, _rels_path_for(workbook_part))
+        workbook_root = ET.fromstring(zf.read(workbook_part))
+
+        sheet_names = []
+        sheet_parts = {}
+        for sheet in workbook_root.iter(f"{{{MAIN_NS}}}sheet"):
+            name = sheet.get("name")
+            rel = workbook_rels.get(sheet.get(f"{{{DOC_REL_NS}}}id"))
+            if not rel:
+                continue
+            sheet_names.append(name)
+            sheet_parts[name.lower()] = (name, _resolve_part_path(workbook_dir, rel[0]))
+
+        external_books = {}
+        for i, ext_ref in enumerate(workbook_root.iter(f"{{{MAIN_NS}}}externalReference")):
+            rel = workbook_rels.get(ext_ref.get(f"{{{DOC_REL_NS}}}id"))
+            if not rel:
+                continue
+            link_part = _resolve_part_path(workbook_dir, rel[0])
+            link_rels = _read_relationships(zf, _rels_path_for(link_part))
+            for target, _, _ in link_rels.values():
+                if target:
+                    external_books[str(i + 1)] = target
+                    break
+
+        defined_names = {}
+        for defined_name in workbook_root.iter(f"{{{MAIN_NS}}}definedName"):
+            name = defined_name.get("name")
+            if not name or not defined_name.text:
+                continue
+            local_sheet_id = defined_name.get("localSheetId")
+            scope = int(local_sheet_id) if local_sheet_id is not None else None
+            defined_names[(name.lower(), scope)] = defined_name.text
+
+        shared_strings_part = None
+        date_style_ids = timedelta_style_ids = frozenset()
+        for target, _, rel_type in workbook_rels.values():
+            if not rel_type or not target:
+                continue
+            if rel_type.endswith("/sharedStrings"):
+                shared_strings_part = _resolve_part_path(workbook_dir, target)
+            elif rel_type.endswith("/styles"):
+                date_style_ids, timedelta_style_ids = _read_date_style_ids(zf, _resolve_part_path(workbook_dir, target))
+
+        workbook_pr = workbook_root.find(f"{{{MAIN_NS}}}workbookPr")
+        date1904 = workbook_pr is not None and workbook_pr.get("date1904") in ("1", "true")
+
+    return WorkbookParts(sheet_names, sheet_parts, external_books, defined_names,
+                         shared_strings_part, date_style_ids, timedelta_style_ids,
+                         CALENDAR_MAC_1904 if date1904 else CALENDAR_WINDOWS_1900)
+
+
+def _read_date_style_ids(zf, styles_part):
+    """找出數字格式為日期 / 時間長度的 cellXfs 索引，用於把快取值轉成 datetime"""
+    try:
+        root = ET.fromstring(zf.read(styles_part))
+    except KeyError:
+        return frozenset(), frozenset()
+    custom_formats = {
+        int(num_fmt.get("numFmtId")): num_fmt.get("formatCode")
+        for num_fmt in root.iter(f"{{{MAIN_NS}}}numFmt")
+    }
+    date_ids = set()
+    timedelta_ids = set()
+    cell_xfs = root.find(f"{{{MAIN_NS}}}cellXfs")
+    if cell_xfs is not None:
+        for i, xf in enumerate(cell_xfs.findall(f"{{{MAIN_NS}}}xf")):
+            num_fmt_id = int(xf.get("numFmtId", 0))
+            format_code = custom_formats.get(num_fmt_id) or BUILTIN_FORMATS.get(num_fmt_id)
+            if format_code and is_date_format(format_code):
+                date_ids.add(i)
+                if is_timedelta_format(format_code):
+                    timedelta_ids.add(i)
+    return frozenset(date_ids), frozenset(timedelta_ids)
+
+
+_workbook_parts_cache = FingerprintLRUCache(WORKBOOK_PARTS_CACHE_SIZE, size_estimator=lambda file_path, parts: 1)
+
+def get_workbook_parts(file_path):
+    """獲取快取的 WorkbookParts，檔案變更時自動重新讀取"""
+    return _workbook_parts_cache.get(file_path, file_path, lambda: _read_workbook_parts(file_path))
+
+
+def external_book_path(target, working_path):
+    """把外部連結目標（file:///C:\\...\\B.xlsx 或 B.xlsx）轉為工作目錄下的完整路徑"""
+    filename = re.split(r"[\\/]", target)[-1]
+    return os.path.join(working_path, filename)
+
+
+def split_cell_reference(cell_address):
+    """單一儲存格位址（可含 $）轉 (row, col)"""
+    column_letters, row = coordinate_from_string(cell_address.replace("$", "").upper())
+    return row, column_index_from_string(column_letters)
+
+
+def iter_sheet_cells(zf, part_path):
+    """
+    以 iterparse 串流讀取工作表 XML，逐一產生
+    (row, col, coordinate, formula, array_ref, value_text, data_type, style_index)。
+    非公式儲存格的 formula 為 None；共用公式 (t="shared") 的主公式只拆解一次（R1C1 相對形式），
+    其他儲存格依各自位置平移還原。
+    已處理的 row 元素即時清除，記憶體用量不隨工作表大小增長。
+    """
+    shared_masters = {}
+    sheet_data = None
+    current_row = 0
+    current_col = 0
+    with zf.open(part_path) as stream:
+        for event, element in ET.iterparse(stream, events=("start", "end")):
+            tag = element.tag
+            if event == "start":
+                if tag == _TAG_SHEET_DATA:
+                    sheet_data = element
+                elif tag == _TAG_ROW:
+                    row_attr = element.get("r")
+                    current_row = int(row_attr) if row_attr else current_row + 1
+                    current_col = 0
+                continue
+
+            if tag == _TAG_CELL:
+                coordinate = element.get("r")
+                if coordinate:
+                    row, current_col = split_cell_reference(coordinate)
+                else:
+                    current_col += 1
+                    row = current_row
+                    coordinate = f"{_column_letter(current_col)}{row}"
+
+                data_type = element.get("t")
+                if data_type == "inlineStr":
+                    inline_element = element.find(_TAG_INLINE_STRING)
+                    value_text = "".join(t.text or "" for t in inline_element.iter(_TAG_TEXT)) if inline_element is not None else None
+                else:
+                    value_element = element.find(_TAG_VALUE)
+                    value_text = value_element.text if value_element is not None else None
+
+                formula = None
+                array_ref = None
+                formula_element = element.find(_TAG_FORMULA)
+                if formula_element is not None:
+                    formula_type = formula_element.get("t")
+                    text = formula_element.text
+                    if formula_type == "shared":
+                        shared_index = formula_element.get("si")
+                        if text:
+                            formula = f"={text}"
+                            shared_masters[shared_index] = split_relative_formula(formula, row, current_col)
+                        elif shared_index in shared_masters:
+                            formula = render_relative_formula(shared_masters[shared_index], row, current_col)
+                    elif formula_type != "dataTable" and text is not None:
+                        formula = f"={text}"
+                        if formula_type == "array":
+                            array_ref = formula_element.get("ref") or coordinate
+
+                if formula is None and value_text is None:
+                    continue
+                yield row, current_col, coordinate, formula, array_ref, value_text, data_type, element.get("s")
+            elif tag == _TAG_ROW and sheet_data is not None:
+                sheet_data.clear()
+
+
+def _column_letter(column_index):
+    letters = ""
+    while column_index:
+        column_index, remainder = divmod(column_index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _relative_cell(col_abs, letters, row_abs, digits, row, col):
+    """把 A1 / $A$1 各部分轉成 (欄絕對, 欄, 列絕對, 列)，相對部分記錄相對於 (row, col) 的位移；超出工作表範圍時返回 None"""
+    ref_col = column_index_from_string(letters.upper())
+    ref_row = int(digits)
+    if ref_col > _MAX_COL or not 1 <= ref_row <= _MAX_ROW:
+        return None
+    return (bool(col_abs), ref_col if col_abs else ref_col - col, bool(row_abs), ref_row if row_abs else ref_row - row)
+
+
+def _relative_line(text, origin, is_col):
+    """整欄 / 整列引用的一端（A / $A / 1 / $1），返回與 _relative_cell 相同格式、缺少的部分為 None"""
+    is_abs = text.startswith("$")
+    text = text.lstrip("$")
+    value = column_index_from_string(text.upper()) if is_col else int(text)
+    if not 1 <= value <= (_MAX_COL if is_col else _MAX_ROW):
+        return None
+    if not is_abs:
+        value -= origin
+    return (is_abs, value, False, None) if is_col else (False, None, is_abs, value)
+
+
+def split_relative_formula(formula, row, col):
+    """
+    把位於 (row, col) 的公式拆成文字片段與引用片段，返回 tuple（可作為字典鍵）。
+    引用片段為 (欄絕對, 欄, 列絕對, 列)，相對的欄 / 列記錄位移，整欄 / 整列引用缺少的部分為 None；
+    同一公式向下 / 向右複製後拆出的結果相同（即 R1C1 相對形式）。
+    """
+    pieces = []
+    position = 0
+    for match in _RELATIVE_REF_RE.finditer(formula):
+        kind = match.lastgroup
+        if kind == "literal":
+            continue
+        if kind == "digits":
+            refs = (_relative_cell(*match.group("col_abs", "letters", "row_abs", "digits"), row, col),)
+        elif kind == "col2":
+            refs = (_relative_line(match.group("col1"), col, True), _relative_line(match.group("col2"), col, True))
+        else:
+            refs = (_relative_line(match.group("row1"), row, False), _relative_line(match.group("row2"), row, False))
+        if None in refs:
+            continue  # 超出工作表範圍，是名稱而非引用，原樣保留
+        pieces.append(formula[position:match.start()])
+        for i, ref in enumerate(refs):
+            if i:
+                pieces.append(":")
+            pieces.append(ref)
+        position = match.end()
+    pieces.append(formula[position:])
+    return tuple(pieces)
+
+
+def _a1_reference(piece, row, col):
+    col_abs, ref_col, row_abs, ref_row = piece
+    text = ""
+    if ref_col is not None:
+        if not col_abs:
+            ref_col += col
+        if not 1 <= ref_col <= _MAX_COL:
+            return "#REF!"
+        text = ("$" if col_abs else "") + get_column_letter(ref_col)
+    if ref_row is not None:
+        if not row_abs:
+            ref_row += row
+        if not 1 <= ref_row <= _MAX_ROW:
+            return "#REF!"
+        text += ("$" if row_abs else "") + str(ref_row)
+    return text
+
+
+def render_relative_formula(pieces, row, col):
+    """split_relative_formula 的反向：返回放在 (row, col) 時的 A1 公式；平移後超出工作表範圍的引用為 #REF!"""
+    return "".join(piece if piece.__class__ is str else _a1_reference(piece, row, col) for piece in pieces)
+
+
+def _iter_range_operands(formula):
+    for token in Tokenizer(formula).items:
+        if token.type == Token.OPERAND and token.subtype == Token.RANGE:
+            yield token.value
+
+
+def _normalize_address(address):
+    return address.replace("$", "").upper()
+
+
+def _resolve_operand(operand, file_path, sheet_name, parts, working_path, depth):
+    """把單一 RANGE 運算元轉成任務列表；無法辨識的運算元（表格引用等）返回空列表"""
+    match = _REF_OPERAND_RE.match(operand)
+    if not match:
+        return _resolve_defined_name(operand, file_path, sheet_name, parts, working_path, depth)
+
+    address = _normalize_address(match.group("address"))
+    prefix = match.group("prefix")
+    if prefix is None:
+        return [{"file": file_path, "sheet": sheet_name, "cell": address}]
+
+    if prefix.startswith("'") and prefix.endswith("'"):
+        prefix = prefix[1:-1].replace("''", "'")
+
+    book_match = _BOOK_PREFIX_RE.match(prefix)
+    if book_match:
+        book = book_match.group("book")
+        ref_sheet = book_match.group("sheet")
+        if book.isdigit():
+            target = parts.external_books.get(book)
+            if target is None:
+                return []
+            dep_file = external_book_path(target, working_path)
+        elif book_match.group("path"):
+            dep_file = os.path.join(book_match.group("path"), book)
+        else:
+            dep_file = os.path.join(working_path, book)
+        if os.path.normcase(dep_file) == os.path.normcase(file_path):
+            ref_sheet = parts.resolve_sheet_name(ref_sheet) or ref_sheet
+        return [{"file": dep_file, "sheet": ref_sheet, "cell": address}]
+
+    if ":" in prefix:
+        # 3D 引用 Sheet1:Sheet3!A1 依活頁簿順序展開到每個工作表
+        first, last = (parts.resolve_sheet_name(s) for s in prefix.split(":", 1))
+        if first and last:
+            start, end = sorted((parts.sheet_names.index(first), parts.sheet_names.index(last)))
+            return [{"file": file_path, "sheet": s, "cell": address} for s in parts.sheet_names[start:end + 1]]
+        return []
+
+    return [{"file": file_path, "sheet": parts.resolve_sheet_name(prefix) or prefix, "cell": address}]
+
+
+def _resolve_defined_name(operand, file_path, sheet_name, parts, working_path, depth):
+    if depth >= _MAX_NAME_DEPTH:
+        return []
+    name_key = operand.lower()
+    scope = parts.sheet_names.index(sheet_name) if sheet_name in parts.sheet_names else None
+    definition = parts.defined_names.get((name_key, scope)) or parts.defined_names.get((name_key, None))
+    if not definition:
+        return []
+    return _extract_references(f"={definition}", file_path, sheet_name, parts, working_path, depth + 1)
+
+
+def _extract_references(formula, file_path, sheet_name, parts, working_path, depth):
+    references = []
+    for operand in _iter_range_operands(formula):
+        references.extend(_resolve_operand(operand, file_path, sheet_name, parts, working_path, depth))
+    return references
+
+
+# (R1C1 相對形式, 檔案, 工作表, working_path, WorkbookParts) -> 解析後的引用範本；
+# 滿了就整個清空（複製區塊通常連續出現，很快會重新填滿）
+_relative_references_cache = {}
+
+
+def _relative_references(formula, row, col, file_path, sheet_name, parts, working_path):
+    """
+    返回位於 (row, col) 的公式的引用（未去重），與 _extract_references 相同。
+    相同 R1C1 相對形式的公式只 tokenize 並解析第一個，其餘把快取的引用位址平移到各自的位置。
+    """
+    pieces = split_relative_formula(formula, row, col)
+    cache_key = (pieces, file_path, sheet_name, working_path, parts)
+    templates = _relative_references_cache.get(cache_key)
+    if templates is None:
+        templates = []
+        for operand in _iter_range_operands(formula):
+            match = _REF_OPERAND_RE.match(operand)
+            # 儲存格 / 範圍引用記錄位址的相對片段；定義名稱的引用不隨公式位置改變
+            address = split_relative_formula(match.group("address"), row, col) if match else None
+            for ref in _resolve_operand(operand, file_path, sheet_name, parts, working_path, 0):
+                templates.append((ref["file"], ref["sheet"], address or ref["cell"]))
+        if len(_relative_references_cache) >= RELATIVE_FORMULA_CACHE_SIZE:
+            _relative_references_cache.clear()
+        _relative_references_cache[cache_key] = templates
+    return [
+        {"file": ref_file, "sheet": ref_sheet,
+         "cell": cell if cell.__class__ is str else render_relative_formula(cell, row, col).replace("$", "")}
+        for ref_file, ref_sheet, cell in templates
+    ]
+
+
+def extract_references(formula, file_path, sheet_name, working_path=None, origin=None):
+    """
+    從公式字串找出所有儲存格 / 範圍引用，返回去重後的 {"file","sheet","cell"} 任務列表。
+    外部活頁簿索引 [n] 依 xl/externalLinks 的連結目標轉為 working_path 下的檔案路徑。
+    提供公式所在的 origin=(row, col) 時，向下 / 向右複製的公式共用同一次 tokenize 結果。
+    """
+    if working_path is None:
+        working_path = os.path.dirname(file_path)
+    parts = get_workbook_parts(file_path)
+    sheet_name = parts.resolve_sheet_name(sheet_name) or sheet_name
+    if origin is None:
+        references = _extract_references(formula, file_path, sheet_name, parts, working_path, 0)
+    else:
+        references = _relative_references(formula, *origin, file_path, sheet_name, parts, working_path)
+    seen = set()
+    unique_references = []
+    for ref in references:
+        key = (ref["file"], ref["sheet"].lower(), ref["cell"])
+        if key not in seen:
+            seen.add(key)
+            unique_references.append(ref)
+    return unique_references
@@ -0,0 +1,138 @@
+import os
+import threading
+
+from dependency_graph import DependencyGraph, node_key
+from dependency_engine import indexed_trace_dependency_vine, commit_dependency_index
+from trace_result import TraceNode, TraceResult
+
+# 按需展開的追蹤：一開始只追蹤根節點與其直接引用，節點展開時才追蹤下一層，
+# 同時在背景執行緒預先追蹤再下一層，使用者展開時通常已完成。
+
+
+class LazyTracer:
+    """
+    按需追蹤單一根任務。result 是持續更新的 TraceResult（同一個物件），
+    只在呼叫 start() / expand() 的執行緒（Tk 主執行緒）中修改；
+    背景預先追蹤的結果先存在 _prefetched，展開時才併入依賴圖。
+    """
+
+    def __init__(self, root_task, working_path=None, trace_function=None, prefetch=True):
+        self.root_task = root_task
+        self.working_path = working_path if working_path is not None else os.path.dirname(root_task["file"])
+        self.trace_function = trace_function or indexed_trace_dependency_vine
+        self.graph = DependencyGraph()
+        self.graph.roots.append(node_key(root_task))
+        self.result = TraceResult({}, {}, list(self.graph.roots), set())
+
+        self._lock = threading.Condition()
+        self._prefetch_queue = []  # 堆疊：最近一次展開的下一層優先
+        self._prefetched = {}      # key -> trace_function 的返回值
+        self._in_flight = None     # 背景執行緒正在追蹤的 key
+        self._closed = False
+        self._thread = None
+        if prefetch:
+            self._thread = threading.Thread(target=self._prefetch_loop, daemon=True)
+            self._thread.start()
+
+    def __len__(self):
+        return len(self.graph)
+
+    def close(self):
+        """停止背景預先追蹤（正在追蹤的儲存格完成後結束）"""
+        with self._lock:
+            self._closed = True
+            self._prefetch_queue.clear()
+            self._lock.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # --- 主執行緒 ---
+
+    def start(self):
+        """追蹤根節點及其直接引用，並開始預先追蹤下一層；返回 result"""
+        self._ensure_traced([self.root_task])
+        return self.expand(node_key(self.root_task))
+
+    def expand(self, key):
+        """確保 key 的直接引用都已追蹤（優先使用預先追蹤的結果），再預先追蹤它們的下一層；返回 result"""
+        children = self.graph.children(key)
+        self._ensure_traced(children)
+        next_level = []
+        for child in children:
+            for grandchild in self.graph.children(node_key(child)):
+                if node_key(grandchild) not in self.graph.results:
+                    next_level.append(grandchild)
+        self._schedule_prefetch(next_level)
+        return self.result
+
+    def is_traced(self, key):
+        return key in self.graph.results
+
+    def _ensure_traced(self, tasks):
+        added = False
+        for task in tasks:
+            key = node_key(task)
+            if key in self.graph.results:
+                continue
+            traced = self._take_prefetched(key)
+            if traced is None:
+                traced = self.trace_function(task, self.working_path)
+            self.graph.add_result(task, traced)
+            node = self.graph.results[key]
+            self.result.nodes[key] = TraceNode(self.graph.tasks[key], node[1], node[2], node[3])
+            self.result.edges[key] = self.graph.edges[key]
+            added = True
+        if added:
+            self.result.cyclic_nodes = set(self.graph.cyclic_nodes)
+            commit_dependency_index()
+
+    def _take_prefetched(self, key):
+        """取出預先追蹤的結果；該儲存格正在背景追蹤時等待它完成，避免重複追蹤"""
+        with self._lock:
+            while self._in_flight == key:
+                self._lock.wait()
+            return self._prefetched.pop(key, None)
+
+    def _schedule_prefetch(self, tasks):
+        if self._thread is None or not tasks:
+            return
+        with self._lock:
+            self._prefetch_queue.extend(reversed(tasks))
+            self._lock.notify_all()
+
+    # --- 背景執行緒 ---
+
+    def _prefetch_loop(self):
+        while True:
+            with self._lock:
+                while not self._prefetch_queue and not self._closed:
+                    self._lock.wait()
+                if self._closed:
+                    return
+                task = self._prefetch_queue.pop()
+                key = node_key(task)
+                if key in self.graph.results or key in self._prefetched:
+                    continue
+                self._in_flight = key
+            try:
+                traced = self.trace_function(task, self.working_path)
+            except Exception:
+                traced = None  # 展開時會在主執行緒重新追蹤並顯示錯誤
+            with self._lock:
+                if traced is not None and key not in self.graph.results:
+                    self._prefetched[key] = traced
+                self._in_flight = None
+                self._lock.notify_all()
+            if not self._prefetch_queue:
+                commit_dependency_index()
+
+
+def start_lazy_trace(task, working_path=None, trace_function=None, prefetch=True):
+    """建立 LazyTracer 並追蹤第一層；返回 tracer（tracer.result 為目前的 TraceResult）"""
+    tracer = LazyTracer(task, working_path, trace_function, prefetch)
+    tracer.start()
+    return tracer
@@ -0,0 +1,63 @@
+import os
+import re
+
+from formula_extractor import split_cell_reference
+
+# formulas.ExcelModel.cells 的鍵形如 '[Book.xlsx]SHEET'!A1 或 '[Book.xlsx]SHEET'!A1:B3，
+# 工作表名稱一律大寫；部分鍵不含活頁簿名稱（'SHEET'!A1）
+_MODEL_KEY_RE = re.compile(r"^'?(?:\[(?P<book>[^\]]+)\])?(?P<sheet>.*?)'?!(?P<ref>[^!]+)$")
+
+
+class ModelCellIndex:
+    """
+    formulas 模型的正規化儲存格索引，模型載入時建立一次。
+    cells: (活頁簿小寫, 工作表小寫, row, col) -> 編譯後的儲存格；
+    ranges: (活頁簿小寫, 工作表小寫, 範圍大寫) -> 編譯後的範圍；
+    sheets: (活頁簿小寫, 工作表小寫) -> 模型中的工作表名稱。
+    不含活頁簿名稱的鍵以空字串作為活頁簿。查詢皆為常數時間，取代逐鍵 .lower() 的線性搜尋。
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.cells = {}
+        self.ranges = {}
+        self.sheets = {}
+        for key, compiled in model.cells.items():
+            match = _MODEL_KEY_RE.match(key)
+            if not match:
+                continue
+            book = (match.group("book") or "").lower()
+            sheet = match.group("sheet")
+            ref = match.group("ref").replace("$", "").upper()
+            sheet_lower = sheet.lower()
+            self.sheets.setdefault((book, sheet_lower), sheet)
+            if ":" in ref:
+                self.ranges[(book, sheet_lower, ref)] = compiled
+                continue
+            try:
+                row, col = split_cell_reference(ref)
+            except ValueError:
+                continue
+            self.cells[(book, sheet_lower, row, col)] = compiled
+
+    def __len__(self):
+        return len(self.cells) + len(self.ranges)
+
+    def sheet_name(self, file_path, sheet_name):
+        """模型中對應的工作表名稱（不分大小寫）；找不到時返回 None"""
+        sheet_lower = sheet_name.lower()
+        return (self.sheets.get((os.path.basename(file_path).lower(), sheet_lower))
+                or self.sheets.get(("", sheet_lower)))
+
+    def lookup(self, file_path, sheet_name, address):
+        """以 (檔案, 工作表, 位址) 查詢編譯後的儲存格或範圍；找不到時返回 None"""
+        book = os.path.basename(file_path).lower()
+        sheet_lower = sheet_name.lower()
+        ref = address.replace("$", "").upper()
+        if ":" in ref:
+            return self.ranges.get((book, sheet_lower, ref)) or self.ranges.get(("", sheet_lower, ref))
+        try:
+            row, col = split_cell_reference(ref)
+        except ValueError:
+            return None
+        return self.cells.get((book, sheet_lower, row, col)) or self.cells.get(("", sheet_lower, row, col))
@@ -0,0 +1,202 @@
+import os
+from itertools import count
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from dependency_graph import DependencyGraph, node_key
+from dependency_engine import indexed_trace_sheet_tasks, commit_dependency_index
+from trace_result import TraceResult
+
+# 跨活頁簿的平行追蹤：每本活頁簿交給固定的 worker 行程處理，worker 的快取（工作表資料、範圍摘要等）
+# 在行程內持續保留；任一活頁簿的結果回來就立即分派它引用到的其他活頁簿，不等同一輪的其他 worker。
+# 每個節點只由其活頁簿所屬的 worker 追蹤一次，輸出與 worker 數量及完成順序無關。
+
+# worker 行程內：目前追蹤工作的編號與 {檔案 key: 已追蹤的節點 key}。
+# 同一活頁簿固定由同一 worker 處理，後續批次不會重新追蹤先前已送回協調者的子樹
+_worker_session = [None, {}]
+
+
+def _trace_workbook_closure(tasks, working_path, session=None):
+    """
+    worker 端：追蹤同一活頁簿的 tasks，並沿著同一活頁簿內的引用繼續追蹤到底，
+    返回 [(task, result), ...]。指向其他活頁簿的引用留給協調者分派。
+    session 相同的呼叫共用已追蹤節點集合，已追蹤過的任務直接略過（不會再次返回）。
+    """
+    file_key = node_key(tasks[0])[0]
+    if session is None:
+        seen = set()
+    else:
+        if _worker_session[0] != session:
+            _worker_session[0] = session
+            _worker_session[1] = {}
+        seen = _worker_session[1].setdefault(file_key, set())
+    traced = []
+    frontier = tasks
+    while frontier:
+        groups = {}
+        for task in frontier:
+            key = node_key(task)
+            if key not in seen:
+                seen.add(key)
+                groups.setdefault(key[1], []).append(task)
+        frontier = []
+        for sheet_key in sorted(groups):
+            group = groups[sheet_key]
+            for task, result in zip(group, indexed_trace_sheet_tasks(group, working_path)):
+                traced.append((task, result))
+                for child in result[0]:
+                    child_key = node_key(child)
+                    if child_key[0] == file_key and child_key not in seen:
+                        frontier.append(child)
+    commit_dependency_index()
+    return traced
+
+
+def _spelling(task):
+    return (task["file"], task["sheet"], task["cell"])
+
+
+class ParallelTracer:
+    """
+    以 max_workers 個單一行程的 ProcessPoolExecutor 平行追蹤。
+    每本活頁簿第一次出現時指派給目前負擔最少的 worker，之後固定由同一 worker 處理，
+    讓該活頁簿只在一個行程中載入與快取。
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executors = []
+        self._assignments = {}  # 正規化檔案路徑 -> worker 編號
+        self._loads = []
+        self._sessions = count()
+        self._session_graph = None  # 目前 session 對應的依賴圖（同一圖的多次建立共用 worker 端的已追蹤集合）
+        self._session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        for executor in self._executors:
+            executor.shutdown()
+        self._executors = []
+        self._assignments.clear()
+        self._loads = []
+        self._session_graph = None
+
+    def _worker_for(self, file_key):
+        worker = self._assignments.get(file_key)
+        if worker is None:
+            if len(self._executors) < self.max_workers:
+                self._executors.append(ProcessPoolExecutor(max_workers=1))
+                self._loads.append(0)
+                worker = len(self._executors) - 1
+            else:
+                worker = min(range(len(self._loads)), key=lambda i: self._loads[i])
+            self._assignments[file_key] = worker
+            self._loads[worker] += 1
+        return worker
+
+    def trace_batches(self, batches, working_path):
+        """每個 batch 為同一活頁簿的任務列表；返回與 batches 順序對應的 [(task, result), ...]"""
+        return [future.result() for future in self._submit_batches(batches, working_path)]
+
+    def _submit_batches(self, batches, working_path, session=None):
+        return [
+            self._executors[worker].submit(_trace_workbook_closure, batch, working_path, session)
+            for worker, batch in ((self._worker_for(node_key(batch[0])[0]), batch) for batch in batches)
+        ]
+
+    def build_dependency_graph(self, root_tasks, working_path, graph=None, on_traced=None):
+        """
+        以活頁簿為單位的平行版 build_dependency_graph：待追蹤任務依檔案分批送到 worker，
+        任一批次完成就合併其結果，並立即把指向其他活頁簿、尚未追蹤也未送出的子任務分派出去。
+        同一張圖的建立中 worker 記得每本活頁簿已追蹤的節點，不會重新追蹤協調者已有的子樹。
+        on_traced(graph, task) 在每個節點合併後呼叫；在其中拋出例外即可中止（已送出的批次仍會完成）。
+        同一節點可能以不同寫法（檔案路徑、工作表名稱的大小寫）被引用，先回來的寫法取決於完成順序；
+        建立結束時 graph.tasks 改為固定規則選出的寫法：根節點用呼叫者給的任務，其他節點用所有引用寫法中最小者。
+        """
+        if graph is None:
+            graph = DependencyGraph()
+        for root_task in root_tasks:
+            root_key = node_key(root_task)
+            if root_key not in graph.roots:
+                graph.roots.append(root_key)
+
+        if graph is not self._session_graph:
+            self._session_graph = graph
+            self._session = next(self._sessions)
+        session = self._session
+        requested = set()  # 已送出但結果可能尚未回來的節點
+        spellings = {}     # 節點 key -> 目前選定的任務寫法
+        fixed = set()      # 寫法固定為根任務的節點
+        for root_task in root_tasks:
+            root_key = node_key(root_task)
+            if root_key not in fixed:
+                fixed.add(root_key)
+                spellings[root_key] = root_task
+        added = []
+
+        def note(task):
+            key = node_key(task)
+            if key in fixed:
+                return
+            current = spellings.get(key)
+            if current is None or _spelling(task) < _spelling(current):
+                spellings[key] = task
+
+        def submit(tasks):
+            by_file = {}
+            for task in tasks:
+                key = node_key(task)
+                if key not in graph.results and key not in requested:
+                    requested.add(key)
+                    by_file.setdefault(key[0], []).append(task)
+            return self._submit_batches([by_file[file_key] for file_key in sorted(by_file)], working_path, session)
+
+        pending = set(submit(root_tasks))
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                discovered = []
+                for future in done:
+                    traced = future.result()
+                    for task, result in traced:
+                        for child in result[0]:
+                            note(child)
+                        if node_key(task) not in graph.results:
+                            added.append(graph.add_result(task, result))
+                            if on_traced is not None:
+                                on_traced(graph, task)
+                    for _, result in traced:
+                        discovered.extend(child for child in result[0] if node_key(child) not in graph.results)
+                pending.update(submit(discovered))
+        finally:
+            for key in added:
+                if key in spellings:
+                    graph.tasks[key] = spellings[key]
+        return graph
+
+
+def trace_tasks_parallel(tasks, working_path=None, max_workers=None, tracer=None):
+    """
+    平行追蹤多個根任務，返回與 tasks 順序對應的 TraceResult 列表（與 trace_tasks 相同）。
+    傳入既有的 tracer 可在多次呼叫間保留 worker 與其快取。
+    """
+    owns_tracer = tracer is None
+    if owns_tracer:
+        tracer = ParallelTracer(max_workers)
+    try:
+        graph = DependencyGraph()
+        roots_by_working_path = {}
+        for task in tasks:
+            task_working_path = working_path if working_path is not None else os.path.dirname(task["file"])
+            roots_by_working_path.setdefault(task_working_path, []).append(task)
+        for task_working_path, root_tasks in roots_by_working_path.items():
+            tracer.build_dependency_graph(root_tasks, task_working_path, graph)
+    finally:
+        if owns_tracer:
+            tracer.close()
+    combined_result = TraceResult.from_graph(graph)
+    return [combined_result.for_root(task) for task in tasks]
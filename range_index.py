@@ -0,0 +1,231 @@
+from bisect import bisect_right
+
+from openpyxl.utils.cell import range_boundaries
+
+# 範圍的二維區間索引：每個工作表一棵以列為軸的中心點區間樹（centered interval tree），
+# 「哪些範圍包含 (row, col)」與「哪些範圍與某區域有交集」不必展開範圍內的每個儲存格，
+# 也不必逐一檢查所有範圍。
+
+EXCEL_MAX_ROW = 1048576
+EXCEL_MAX_COL = 16384
+
+
+def area_bounds(address):
+    """A1 / A1:B3 / A:A / 1:3 轉成 (min_row, min_col, max_row, max_col)，整欄 / 整列延伸到工作表邊界"""
+    min_col, min_row, max_col, max_row = range_boundaries(address.replace("$", "").upper())
+    min_row, max_row = min_row or 1, max_row or EXCEL_MAX_ROW
+    min_col, max_col = min_col or 1, max_col or EXCEL_MAX_COL
+    # B5:A1 與 A1:B5 是同一範圍，區間索引要求起點不大於終點
+    return min(min_row, max_row), min(min_col, max_col), max(min_row, max_row), max(min_col, max_col)
+
+
+class RangeIntervalIndex:
+    """
+    以 (min_row, min_col, max_row, max_col) 表示的範圍，依工作表鍵分開索引。
+    每棵樹的節點保存跨越中心列的範圍，分別依起始列與結束列排序；查詢沿一條路徑往下，
+    列方向為 O(log n + 命中數)，欄再逐一過濾（每個節點另記錄欄的涵蓋區間以整個略過）。
+    新增範圍後，該工作表的樹在下一次查詢時才重新建立。
+    """
+
+    def __init__(self):
+        self._ranges = {}  # 工作表鍵 -> {範圍邊界: None}（保留加入順序並去重）
+        self._trees = {}   # 工作表鍵 -> (範圍邊界列表, 節點列表, 根節點索引, 欄涵蓋表)
+
+    def __len__(self):
+        return sum(len(ranges) for ranges in self._ranges.values())
+
+    def add(self, sheet_key, bounds):
+        """登記一個範圍；同一工作表中相同的範圍只保存一次"""
+        ranges = self._ranges.setdefault(sheet_key, {})
+        if bounds not in ranges:
+            ranges[bounds] = None
+            self._trees.pop(sheet_key, None)
+
+    def ranges(self, sheet_key):
+        return list(self._ranges.get(sheet_key, ()))
+
+    def _tree(self, sheet_key):
+        tree = self._trees.get(sheet_key)
+        if tree is None:
+            bounds_list = list(self._ranges.get(sheet_key, ()))
+            nodes, root = _build_tree(bounds_list)
+            tree = self._trees[sheet_key] = (bounds_list, nodes, root, _column_coverage(bounds_list))
+        return tree
+
+    def covered_columns(self, sheet_key):
+        """欄涵蓋表：covered[col] 非零表示至少一個範圍包含該欄；查詢前先以此略過不在任何範圍欄內的儲存格"""
+        return self._tree(sheet_key)[3]
+
+    def containing(self, sheet_key, row, col):
+        """包含 (row, col) 的範圍"""
+        bounds_list, nodes, node_index, covered = self._tree(sheet_key)
+        found = []
+        if not covered[col]:
+            return found
+        while node_index != -1:
+            center, left, right, min_col, max_col, by_start, by_end = nodes[node_index]
+            check_cols = min_col <= col <= max_col
+            if row < center:
+                # 節點內的範圍都跨越 center，起始列不大於 row 即包含 row
+                if check_cols:
+                    for start, position in by_start:
+                        if start > row:
+                            break
+                        bounds = bounds_list[position]
+                        if bounds[1] <= col <= bounds[3]:
+                            found.append(bounds)
+                node_index = left
+            elif row > center:
+                if check_cols:
+                    for end, position in by_end:
+                        if -end < row:
+                            break
+                        bounds = bounds_list[position]
+                        if bounds[1] <= col <= bounds[3]:
+                            found.append(bounds)
+                node_index = right
+            else:
+                if check_cols:
+                    for _, position in by_start:
+                        bounds = bounds_list[position]
+                        if bounds[1] <= col <= bounds[3]:
+                            found.append(bounds)
+                break
+        return found
+
+    def containing_once(self, sheet_key):
+        """
+        返回查詢函式 take(row, col)：結果與 containing 相同，但同一個 take 對每個範圍只返回一次。
+        已返回的範圍從節點的兩個排序列表中以跳躍指標（路徑壓縮）略過，之後的查詢不會再掃描它；
+        用於影響分析這類只需知道範圍第一次被觸及的走訪，成本不隨同一範圍被觸及的次數增長。
+        """
+        bounds_list, nodes, root, covered = self._tree(sheet_key)
+        states = [None] * len(nodes)  # 節點 -> (by_start 跳躍陣列, by_end 跳躍陣列, 位置 -> by_start 索引, 位置 -> by_end 索引)
+
+        def take(row, col):
+            found = []
+            if not covered[col]:
+                return found
+            node_index = root
+            while node_index != -1:
+                center, left, right, min_col, max_col, by_start, by_end = nodes[node_index]
+                if min_col <= col <= max_col:
+                    state = states[node_index]
+                    if state is None:
+                        state = states[node_index] = (
+                            list(range(len(by_start) + 1)), list(range(len(by_end) + 1)),
+                            {position: i for i, (_, position) in enumerate(by_start)},
+                            {position: i for i, (_, position) in enumerate(by_end)},
+                        )
+                    # row 在中心列以下時依結束列掃描，否則依起始列掃描（與 containing 相同）
+                    if row > center:
+                        entries, skip, other_skip, other_index, limit = by_end, state[1], state[0], state[2], -row
+                    else:
+                        entries, skip, other_skip, other_index, limit = by_start, state[0], state[1], state[3], row if row < center else center
+                    i = skip[0]
+                    if skip[i] != i:
+                        i = _next_unreported(skip, i)
+                    while i < len(entries):
+                        key, position = entries[i]
+                        if key > limit:
+                            break
+                        bounds = bounds_list[position]
+                        if bounds[1] <= col <= bounds[3]:
+                            found.append(bounds)
+                            skip[i] = i + 1
+                            j = other_index[position]
+                            other_skip[j] = j + 1
+                        i += 1
+                        if skip[i] != i:
+                            i = _next_unreported(skip, i)
+                if row < center:
+                    node_index = left
+                elif row > center:
+                    node_index = right
+                else:
+                    break
+            return found
+
+        return take
+
+    def intersecting(self, sheet_key, area):
+        """與 area (min_row, min_col, max_row, max_col) 有交集的範圍"""
+        area_min_row, area_min_col, area_max_row, area_max_col = area
+        bounds_list, nodes, root, _ = self._tree(sheet_key)
+        found = []
+        pending = [root] if root != -1 else []
+        while pending:
+            center, left, right, min_col, max_col, by_start, by_end = nodes[pending.pop()]
+            check_cols = min_col <= area_max_col and area_min_col <= max_col
+            if area_max_row < center:
+                candidates = by_start[:bisect_right(by_start, (area_max_row, len(bounds_list)))] if check_cols else ()
+                next_nodes = (left,)
+            elif area_min_row > center:
+                candidates = by_end[:bisect_right(by_end, (-area_min_row, len(bounds_list)))] if check_cols else ()
+                next_nodes = (right,)
+            else:
+                candidates = by_start if check_cols else ()
+                next_nodes = (right, left)
+            for _, position in candidates:
+                bounds = bounds_list[position]
+                if bounds[1] <= area_max_col and area_min_col <= bounds[3]:
+                    found.append(bounds)
+            pending.extend(node for node in next_nodes if node != -1)
+        return found
+
+
+def _next_unreported(skip, i):
+    """skip[i] == i 表示項目 i 尚未返回；沿指標找到 i 之後第一個未返回的項目，並壓縮走過的路徑"""
+    target = i
+    while skip[target] != target:
+        target = skip[target]
+    while skip[i] != target:
+        skip[i], i = target, skip[i]
+    return target
+
+
+def _column_coverage(bounds_list):
+    """欄號 -> 是否被任一範圍涵蓋（bytearray，索引 0 不用）；相同的欄區間只填一次"""
+    covered = bytearray(EXCEL_MAX_COL + 1)
+    for min_col, max_col in {(bounds[1], bounds[3]) for bounds in bounds_list}:
+        covered[min_col:max_col + 1] = b"\x01" * (max_col - min_col + 1)
+    return covered
+
+
+def _build_tree(bounds_list):
+    """
+    建立中心點區間樹，返回 (節點列表, 根節點索引)；空樹的根為 -1。
+    節點為 (中心列, 左子, 右子, 最小欄, 最大欄, [(起始列, 位置)] 遞增, [(-結束列, 位置)] 遞增)。
+    中心取所有端點的中位數，每層兩側的端點數量至少減半，樹高為 O(log n)。
+    """
+    nodes = []
+    if not bounds_list:
+        return nodes, -1
+    # 堆疊項目：(範圍位置列表, 父節點索引, 掛在父節點的哪一側 1=左 2=右)
+    stack = [(list(range(len(bounds_list))), -1, 0)]
+    while stack:
+        positions, parent, side = stack.pop()
+        endpoints = sorted([bounds_list[p][0] for p in positions] + [bounds_list[p][2] for p in positions])
+        center = endpoints[len(endpoints) // 2]
+        left, right, here = [], [], []
+        for position in positions:
+            bounds = bounds_list[position]
+            if bounds[2] < center:
+                left.append(position)
+            elif bounds[0] > center:
+                right.append(position)
+            else:
+                here.append(position)
+        node = [center, -1, -1,
+                min(bounds_list[p][1] for p in here), max(bounds_list[p][3] for p in here),
+                sorted((bounds_list[p][0], p) for p in here),
+                sorted((-bounds_list[p][2], p) for p in here)]
+        node_index = len(nodes)
+        nodes.append(node)
+        if parent != -1:
+            nodes[parent][side] = node_index
+        if left:
+            stack.append((left, node_index, 1))
+        if right:
+            stack.append((right, node_index, 2))
+    return [tuple(node) for node in nodes], 0
@@ -0,0 +1,189 @@
+import os
+import json
+import atexit
+import hashlib
+import threading
+
+from workbook_cache import FingerprintLRUCache, get_file_fingerprint
+from sheet_store import cell_index, get_sheet_store
+
+# 記憶體中保留的範圍摘要數量（每項只有數個數字與一個雜湊字串）
+RANGE_DIGEST_CACHE_SIZE = 100000
+
+
+def _format_summary(rows, cols, total_sum, numeric_count, error_count, text_count, digest):
+    dimension_str = f"[{rows}R x {cols}C]"
+    summary_str = ""
+    if numeric_count > 0:
+        summary_str = f" [Sum: {total_sum:,.2f}]".replace('.00', '')
+    elif error_count > 0:
+        summary_str = f" [Errors: {error_count}]"
+    elif text_count > 0:
+        summary_str = " [Text]"
+    return f"{dimension_str}{summary_str} [Hash: {digest[:8]}...]"
+
+
+def compute_range_digest(sheet_store, min_row, min_col, max_row, max_col):
+    """
+    單次串流計算範圍摘要，返回 (rows, cols, total_sum, numeric_count, error_count, text_count, sha256)。
+    雜湊逐列增量更新（每個儲存格貢獻 "值||"，空白為 "||"，陣列公式為 "ArrayFormula||"），
+    不再累加整個範圍的字串；結果與原本一次 sha256 整串內容完全相同。
+    數值依列優先順序逐一累加，[Sum] 與原本相同，也不隨範圍大小改變加總順序。
+    """
+    rows = max_row - min_row + 1
+    cols = max_col - min_col + 1
+
+    hasher = hashlib.sha256()
+    total_sum = 0
+    numeric_count = 0
+    error_count = 0
+    text_count = 0
+
+    formulas, values, array_refs = sheet_store.formulas, sheet_store.values, sheet_store.array_refs
+    empty_row = ("||" * cols).encode('utf-8')
+
+    for row in range(min_row, max_row + 1):
+        row_start = cell_index(row, min_col)
+        tokens = None
+        for offset in range(cols):
+            index = row_start + offset
+            value = formulas.get(index)
+            if value is None:
+                value = values.get(index)
+                if value is None:
+                    if tokens is not None:
+                        tokens.append("")
+                    continue
+            elif index in array_refs:
+                if tokens is None:
+                    tokens = [""] * offset
+                tokens.append("ArrayFormula")
+                continue
+
+            if tokens is None:
+                tokens = [""] * offset
+            if isinstance(value, (int, float)):
+                numeric_count += 1
+                total_sum += value
+            elif isinstance(value, str):
+                if value.startswith('#'):
+                    error_count += 1
+                else:
+                    text_count += 1
+            tokens.append(str(value))
+
+        if tokens is None:
+            hasher.update(empty_row)
+        else:
+            hasher.update(("||".join(tokens) + "||").encode('utf-8'))
+
+    return (rows, cols, total_sum, numeric_count, error_count, text_count, hasher.hexdigest())
+
+
+def summarize_range(sheet_store, min_row, min_col, max_row, max_col):
+    """範圍的 [維度] [Sum/Errors/Text] [Hash] 摘要字串"""
+    return _format_summary(*compute_range_digest(sheet_store, min_row, min_col, max_row, max_col))
+
+
+def _normalize_range(address):
+    return address.replace("$", "").upper()
+
+
+class RangeDigestStore:
+    """
+    範圍摘要的磁碟快取（JSON）。鍵包含檔案的 (mtime, size) 指紋，
+    檔案修改後舊摘要自然不再命中，儲存時一併清除。
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._entries = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    @staticmethod
+    def _key(workbook_path, fingerprint, sheet_name, address):
+        return json.dumps([os.path.normcase(workbook_path), fingerprint[0], fingerprint[1],
+                           sheet_name.lower(), _normalize_range(address)])
+
+    def get(self, workbook_path, fingerprint, sheet_name, address):
+        entry = self._entries.get(self._key(workbook_path, fingerprint, sheet_name, address))
+        return tuple(entry) if entry else None
+
+    def put(self, workbook_path, fingerprint, sheet_name, address, digest):
+        with self._lock:
+            self._entries[self._key(workbook_path, fingerprint, sheet_name, address)] = list(digest)
+            self._dirty = True
+
+    def save(self):
+        """寫回磁碟（先寫暫存檔再取代，避免中途失敗留下損毀的檔案）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            current = {}
+            entries = {}
+            for key, digest in self._entries.items():
+                workbook_path, mtime_ns, size = json.loads(key)[:3]
+                if workbook_path not in current:
+                    current[workbook_path] = get_file_fingerprint(workbook_path)
+                if current[workbook_path] == (mtime_ns, size):
+                    entries[key] = digest
+            temp_path = f"{self.file_path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(temp_path, self.file_path)
+            self._entries = entries
+            self._dirty = False
+
+
+_range_digest_cache = FingerprintLRUCache(RANGE_DIGEST_CACHE_SIZE, size_estimator=lambda file_path, digest: 1)
+_range_digest_store = None
+
+
+def set_range_digest_cache_file(file_path):
+    """啟用（或以 None 停用）範圍摘要的磁碟快取；程式結束時自動寫回"""
+    global _range_digest_store
+    if _range_digest_store is not None:
+        _range_digest_store.save()
+    _range_digest_store = RangeDigestStore(file_path) if file_path else None
+
+
+def save_range_digest_cache():
+    if _range_digest_store is not None:
+        _range_digest_store.save()
+
+atexit.register(save_range_digest_cache)
+
+
+def _load_range_digest(file_path, sheet_name, address):
+    store = _range_digest_store
+    fingerprint = get_file_fingerprint(file_path) if store is not None else None
+    if fingerprint is not None:
+        digest = store.get(file_path, fingerprint, sheet_name, address)
+        if digest is not None:
+            return digest
+
+    sheet_store = get_sheet_store(file_path, sheet_name)
+    digest = compute_range_digest(sheet_store, *sheet_store.range_bounds(address))
+    if fingerprint is not None:
+        store.put(file_path, fingerprint, sheet_name, address, digest)
+    return digest
+
+
+def get_range_summary(file_path, sheet_name, address):
+    """
+    以 (檔案, 指紋, 工作表, 正規化範圍) 快取的範圍摘要字串。
+    同一查找表在多個分支重複出現時直接命中快取，不必重新載入工作表與計算雜湊。
+    """
+    key = (os.path.normcase(file_path), sheet_name.lower(), _normalize_range(address))
+    digest = _range_digest_cache.get(key, file_path, lambda: _load_range_digest(file_path, sheet_name, address))
+    return _format_summary(*digest)
+
+
+def clear_range_digest_cache():
+    _range_digest_cache.clear()
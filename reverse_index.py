@@ -0,0 +1,222 @@
+import os
+
+from openpyxl.utils.cell import get_column_letter
+
+from formula_extractor import get_workbook_parts, external_book_path, extract_references
+from sheet_store import get_sheet_store, cell_position
+from range_index import RangeIntervalIndex, area_bounds
+
+# 反向依賴索引（被引用儲存格 -> 引用它的公式儲存格），用於「修改這個輸入會影響哪些儲存格」的影響分析。
+
+# 不超過此儲存格數的小範圍（如 SUM(B1:B6)）直接展開登記到每個儲存格，查詢時不必做包含判斷
+SMALL_RANGE_EXPAND_CELLS = 64
+
+
+class ReverseDependencyIndex:
+    """
+    工作表層級的反向依賴索引。
+    cell_dependents: (檔案, 工作表小寫) -> {(row, col): [引用者]}（含展開後的小範圍）；
+    range_dependents: (檔案, 工作表小寫) -> {範圍邊界: [引用者]}（大範圍）。
+    大範圍不展開，另登記在 RangeIntervalIndex：查詢包含某儲存格 / 與某區域有交集的範圍
+    只需沿區間樹走一條路徑，不必逐一檢查所有範圍。
+    引用者以 (檔案, 工作表小寫, row, col) 表示，檔案路徑皆經 os.path.normcase 正規化。
+    """
+
+    def __init__(self):
+        self.cell_dependents = {}
+        self.range_dependents = {}
+        self.range_index = RangeIntervalIndex()
+        self.sheet_names = {}  # (檔案, 工作表小寫) -> 實際工作表名稱
+        self.file_names = {}   # 正規化路徑 -> 原始路徑
+        self.formula_count = 0
+
+    def _sheet_key(self, file_path, sheet_name):
+        path = os.path.normcase(file_path)
+        self.file_names.setdefault(path, file_path)
+        sheet_key = (path, sheet_name.lower())
+        self.sheet_names.setdefault(sheet_key, sheet_name)
+        return sheet_key
+
+    def add_formula(self, file_path, sheet_name, row, col, references):
+        """登記一個公式儲存格及其引用（extract_references 的結果）"""
+        dependent = self._sheet_key(file_path, sheet_name) + (row, col)
+        self.formula_count += 1
+        for reference in references:
+            try:
+                bounds = area_bounds(reference["cell"])
+            except ValueError:
+                continue
+            sheet_key = self._sheet_key(reference["file"], reference["sheet"])
+            min_row, min_col, max_row, max_col = bounds
+            if (max_row - min_row + 1) * (max_col - min_col + 1) <= SMALL_RANGE_EXPAND_CELLS:
+                cells = self.cell_dependents.setdefault(sheet_key, {})
+                for row in range(min_row, max_row + 1):
+                    for col in range(min_col, max_col + 1):
+                        cells.setdefault((row, col), []).append(dependent)
+                continue
+            ranges = self.range_dependents.setdefault(sheet_key, {})
+            if bounds not in ranges:
+                ranges[bounds] = []
+                self.range_index.add(sheet_key, bounds)
+            ranges[bounds].append(dependent)
+
+    def direct_dependents(self, sheet_key, row, col):
+        """直接引用 (row, col) 的公式儲存格：單一儲存格引用與包含它的範圍引用"""
+        cells = self.cell_dependents.get(sheet_key)
+        dependents = cells.get((row, col), []) if cells else []
+        ranges = self.range_dependents.get(sheet_key)
+        if ranges:
+            dependents = list(dependents)
+            for bounds in self.range_index.containing(sheet_key, row, col):
+                dependents.extend(ranges[bounds])
+        return dependents
+
+    def _area_dependents(self, sheet_key, bounds):
+        """引用與指定區域有交集的所有公式儲存格"""
+        min_row, min_col, max_row, max_col = bounds
+        dependents = []
+        cells = self.cell_dependents.get(sheet_key, {})
+        if (max_row - min_row + 1) * (max_col - min_col + 1) <= len(cells):
+            for row in range(min_row, max_row + 1):
+                for col in range(min_col, max_col + 1):
+                    dependents.extend(cells.get((row, col), ()))
+        else:
+            for (row, col), cell_dependents in cells.items():
+                if min_row <= row <= max_row and min_col <= col <= max_col:
+                    dependents.extend(cell_dependents)
+        ranges = self.range_dependents.get(sheet_key)
+        if ranges:
+            for range_bounds in self.range_index.intersecting(sheet_key, bounds):
+                dependents.extend(ranges[range_bounds])
+        return dependents
+
+    def _to_task(self, dependent):
+        path, sheet_lower, row, col = dependent
+        return {
+            "file": self.file_names.get(path, path),
+            "sheet": self.sheet_names.get((path, sheet_lower), sheet_lower),
+            "cell": f"{get_column_letter(col)}{row}",
+        }
+
+    def impact(self, file_path, sheet_name, address):
+        """
+        影響分析：返回受 file_path / sheet_name!address（儲存格或範圍）影響的完整下游儲存格，
+        依廣度優先順序排列，每個儲存格只出現一次（循環引用不會重複走訪）。
+        """
+        return [self._to_task(dependent) for dependent in self.impact_keys(file_path, sheet_name, address)]
+
+    def impact_keys(self, file_path, sheet_name, address):
+        """同 impact，但返回內部鍵 (檔案, 工作表小寫, row, col)，省去轉換成任務字典的成本"""
+        sheet_key = (os.path.normcase(file_path), sheet_name.lower())
+        ordered = list(dict.fromkeys(self._area_dependents(sheet_key, area_bounds(address))))
+        seen = set(ordered)
+        # ordered 同時作為廣度優先佇列：依加入順序逐一展開。
+        # 即 direct_dependents 的內嵌版本：連續走訪同一工作表時沿用該表的查詢結構，
+        # 儲存格所在欄不在任何大範圍內時不查區間樹
+        empty = ()
+        takers = {}
+        current_path = current_sheet = None
+        position = 0
+        while position < len(ordered):
+            path, sheet_lower, row, col = ordered[position]
+            position += 1
+            if sheet_lower != current_sheet or path != current_path:
+                current_path, current_sheet = path, sheet_lower
+                sheet_key = (path, sheet_lower)
+                cells = self.cell_dependents.get(sheet_key, {})
+                ranges = self.range_dependents.get(sheet_key)
+                if ranges:
+                    covered = self.range_index.covered_columns(sheet_key)
+                    take = takers.get(sheet_key)
+                    if take is None:
+                        take = takers[sheet_key] = self.range_index.containing_once(sheet_key)
+            direct = cells.get((row, col), empty)
+            if ranges and covered[col]:
+                direct = list(direct)
+                for bounds in take(row, col):
+                    direct.extend(ranges[bounds])
+            for dependent in direct:
+                if dependent not in seen:
+                    seen.add(dependent)
+                    ordered.append(dependent)
+        return ordered
+
+    def dependents(self, file_path, sheet_name, address):
+        """只返回直接引用指定儲存格 / 範圍的公式儲存格"""
+        sheet_key = (os.path.normcase(file_path), sheet_name.lower())
+        unique = dict.fromkeys(self._area_dependents(sheet_key, area_bounds(address)))
+        return [self._to_task(dependent) for dependent in unique]
+
+
+def discover_workbook_family(file_path, working_path=None):
+    """
+    找出與 file_path 直接或間接以外部連結相連的活頁簿（雙向：它引用的與引用它的），
+    候選檔案為工作目錄中的 .xlsx / .xlsm。
+    """
+    if working_path is None:
+        working_path = os.path.dirname(file_path)
+    candidates = {os.path.normcase(file_path): file_path}
+    try:
+        names = os.listdir(working_path)
+    except OSError:
+        names = []
+    for name in names:
+        if name.lower().endswith((".xlsx", ".xlsm")) and not name.startswith("~$"):
+            path = os.path.join(working_path, name)
+            candidates.setdefault(os.path.normcase(path), path)
+
+    neighbours = {path: set() for path in candidates}
+    for path, original in candidates.items():
+        try:
+            external_books = get_workbook_parts(original).external_books
+        except Exception:
+            continue
+        for target in external_books.values():
+            linked = os.path.normcase(external_book_path(target, working_path))
+            if linked in neighbours:
+                neighbours[path].add(linked)
+                neighbours[linked].add(path)
+
+    start = os.path.normcase(file_path)
+    family = [start]
+    seen = {start}
+    for path in family:
+        for linked in sorted(neighbours.get(path, ())):
+            if linked not in seen:
+                seen.add(linked)
+                family.append(linked)
+    return [candidates[path] for path in family]
+
+
+def build_reverse_index(file_paths, working_path=None, index=None):
+    """
+    對每本活頁簿的所有公式儲存格掃描一次，建立反向依賴索引。
+    外部連結 [n] 由 extract_references 依活頁簿的 externalLink 關係解析為完整路徑，
+    因此跨活頁簿的引用也會登記在被引用活頁簿的工作表下。
+    """
+    if index is None:
+        index = ReverseDependencyIndex()
+    for file_path in file_paths:
+        book_working_path = working_path or os.path.dirname(file_path)
+        try:
+            parts = get_workbook_parts(file_path)
+        except Exception as e:
+            print(f"Warning: Could not index {file_path}: {e}")
+            continue
+        for actual_sheet_name in parts.sheet_names:
+            sheet_store = get_sheet_store(file_path, actual_sheet_name)
+            for index_value, formula in sheet_store.formulas.items():
+                try:
+                    references = extract_references(formula, file_path, actual_sheet_name, book_working_path)
+                except Exception:
+                    continue
+                row, col = cell_position(index_value)
+                index.add_formula(file_path, actual_sheet_name, row, col, references)
+    return index
+
+
+def impact_analysis(file_path, sheet_name, address, working_path=None):
+    """建立 file_path 所屬活頁簿群組的反向索引，返回指定儲存格 / 範圍的完整下游影響範圍"""
+    family = discover_workbook_family(file_path, working_path)
+    index = build_reverse_index(family, working_path)
+    return index.impact(file_path, sheet_name, address)
@@ -0,0 +1,103 @@
+import os
+import time
+import queue
+import threading
+
+from dependency_graph import DependencyGraph, node_key
+from dependency_engine import trace_task
+from parallel_trace import ParallelTracer
+from trace_result import TraceResult
+
+# 背景掃描：追蹤在背景執行緒進行，進度、部分結果與最終結果經由 queue 傳回，
+# 由 Tk 主執行緒以 after() 定期取出，視窗在長時間掃描中仍可操作。
+
+PROGRESS_INTERVAL = 0.1        # 秒；進度訊息的最短間隔
+PARTIAL_RESULT_INTERVAL = 1.0  # 秒；部分結果需複製整張圖，間隔較長
+
+
+class ScanCancelled(Exception):
+    pass
+
+
+class ScanWorker:
+    """
+    在背景執行緒追蹤單一任務。messages 中的訊息：
+    ("progress", {"nodes", "files", "elapsed"})、("partial", TraceResult)、
+    ("done", TraceResult)、("cancelled", TraceResult)、("error", 錯誤訊息)。
+    cancel() 後追蹤會在下一個節點完成時停止。
+    max_workers 大於 1 時以 ParallelTracer 在多個行程中平行追蹤各活頁簿（trace_function 不適用）。
+    """
+
+    def __init__(self, task, working_path=None, trace_function=None, max_workers=None):
+        self.task = task
+        self.working_path = working_path
+        self.trace_function = trace_function
+        self.max_workers = max_workers
+        self.messages = queue.Queue()
+        self._cancel_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def drain(self):
+        """取出目前所有訊息（不阻塞）"""
+        messages = []
+        while True:
+            try:
+                messages.append(self.messages.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def _run(self):
+        started = time.monotonic()
+        graph = DependencyGraph()
+        files = set()
+        last_sent = {"progress": 0.0, "partial": started}
+
+        def progress():
+            return {"nodes": len(graph), "files": len(files), "elapsed": time.monotonic() - started}
+
+        def on_traced(graph, task):
+            if self._cancel_event.is_set():
+                raise ScanCancelled()
+            files.add(node_key(task)[0])
+            now = time.monotonic()
+            if now - last_sent["progress"] >= PROGRESS_INTERVAL:
+                last_sent["progress"] = now
+                self.messages.put(("progress", progress()))
+            if now - last_sent["partial"] >= PARTIAL_RESULT_INTERVAL:
+                last_sent["partial"] = now
+                self.messages.put(("partial", TraceResult.from_graph(graph)))
+
+        try:
+            if self.max_workers and self.max_workers > 1:
+                working_path = self.working_path if self.working_path is not None else os.path.dirname(self.task["file"])
+                with ParallelTracer(self.max_workers) as tracer:
+                    tracer.build_dependency_graph([self.task], working_path, graph, on_traced)
+                result = TraceResult.from_graph(graph)
+            else:
+                result = trace_task(self.task, self.trace_function, self.working_path, graph, on_traced)
+        except ScanCancelled:
+            self.messages.put(("progress", progress()))
+            self.messages.put(("cancelled", TraceResult.from_graph(graph)))
+        except Exception as e:
+            self.messages.put(("error", str(e)))
+        else:
+            self.messages.put(("progress", progress()))
+            self.messages.put(("done", result))
+
+
+def start_scan_worker(task, working_path=None, trace_function=None, max_workers=None):
+    return ScanWorker(task, working_path, trace_function, max_workers).start()
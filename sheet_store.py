@@ -0,0 +1,206 @@
+import zipfile
+import xml.etree.ElementTree as ET
+from openpyxl.worksheet.formula import ArrayFormula
+from openpyxl.utils.cell import range_boundaries
+from openpyxl.utils.datetime import from_excel
+
+from workbook_cache import FingerprintLRUCache
+from formula_extractor import MAIN_NS, get_workbook_parts, iter_sheet_cells
+from workbook_resolver import _format_external_link_target, _resolve_formula_string
+
+# 單次解析的工作表資料：每個工作表 XML 只讀一次，同時保存公式、快取值 (<v>) 與解析外部連結後的公式，
+# 取代原本 data_only=False / data_only=True / resolved 三次載入同一本活頁簿。
+
+SHEET_STORE_MAX_BYTES = 1024 ** 3
+# 每個儲存格在字典中的大約記憶體用量（鍵、值與字串物件）
+BYTES_PER_STORED_CELL = 160
+
+_COLUMN_BITS = 14  # Excel 最多 16384 欄
+
+_TAG_SHARED_ITEM = f"{{{MAIN_NS}}}si"
+_TAG_TEXT = f"{{{MAIN_NS}}}t"
+_TAG_RUN = f"{{{MAIN_NS}}}r"
+
+
+def cell_index(row, col):
+    """把 (row, col) 壓成單一整數鍵，比 tuple 鍵省記憶體"""
+    return (row << _COLUMN_BITS) | (col - 1)
+
+
+def cell_position(index):
+    """cell_index 的反運算，返回 (row, col)"""
+    return index >> _COLUMN_BITS, (index & ((1 << _COLUMN_BITS) - 1)) + 1
+
+
+def _cast_number(value_text):
+    if "." in value_text or "E" in value_text or "e" in value_text:
+        return float(value_text)
+    return int(value_text)
+
+
+class SheetStore:
+    """
+    單一工作表的儲存格資料。
+    formulas: 公式字串 ("=..."，共用公式已展開)；values: 快取值；
+    resolved: 含外部連結 [n] 的公式解析後的顯示字串（與原公式相同者不另存）；
+    array_refs: 陣列公式主儲存格的範圍。
+    """
+    __slots__ = ("file_path", "name", "formulas", "values", "resolved", "array_refs", "max_row", "max_col")
+
+    def __init__(self, file_path, name):
+        self.file_path = file_path
+        self.name = name
+        self.formulas = {}
+        self.values = {}
+        self.resolved = {}
+        self.array_refs = {}
+        self.max_row = 0
+        self.max_col = 0
+
+    def __len__(self):
+        """儲存的項目數（公式與值分開計算），用於估算記憶體"""
+        return len(self.formulas) + len(self.values)
+
+    def formula(self, row, col):
+        return self.formulas.get(cell_index(row, col))
+
+    def cached_value(self, row, col):
+        """對應 openpyxl data_only=True 的值"""
+        return self.values.get(cell_index(row, col))
+
+    def content(self, row, col):
+        """對應 openpyxl data_only=False 的值：公式儲存格返回公式（陣列公式為 ArrayFormula），否則返回值"""
+        index = cell_index(row, col)
+        formula = self.formulas.get(index)
+        if formula is None:
+            return self.values.get(index)
+        array_ref = self.array_refs.get(index)
+        if array_ref is not None:
+            return ArrayFormula(array_ref, formula)
+        return formula
+
+    def display_formula(self, row, col):
+        """外部連結 [n] 已換成完整路徑的公式；不含外部連結時即原公式"""
+        index = cell_index(row, col)
+        return self.resolved.get(index, self.formulas.get(index))
+
+    def range_bounds(self, address):
+        """把 A1:B3 / A:A / 1:3 轉成 (min_row, min_col, max_row, max_col)，整欄 / 整列以已使用範圍為界"""
+        min_col, min_row, max_col, max_row = range_boundaries(address.replace("$", "").upper())
+        return (min_row or 1, min_col or 1, max_row or max(self.max_row, 1), max_col or max(self.max_col, 1))
+
+
+def _read_shared_strings(file_path, shared_strings_part):
+    if not shared_strings_part:
+        return []
+    strings = []
+    with zipfile.ZipFile(file_path) as zf:
+        try:
+            stream = zf.open(shared_strings_part)
+        except KeyError:
+            return []
+        with stream:
+            for _, element in ET.iterparse(stream, events=("end",)):
+                if element.tag != _TAG_SHARED_ITEM:
+                    continue
+                # 純文字在 si/t，格式化文字在 si/r/t；注音 (rPh) 內的文字略過，與 openpyxl 一致
+                texts = element.findall(_TAG_TEXT) + element.findall(f"{_TAG_RUN}/{_TAG_TEXT}")
+                strings.append("".join(t.text or "" for t in texts))
+                element.clear()
+    return strings
+
+
+def _external_link_map(parts):
+    return {index: _format_external_link_target(target) for index, target in parts.external_books.items()}
+
+
+def _convert_value(value_text, data_type, style_index, shared_strings, parts):
+    if value_text is None:
+        return None
+    if data_type == "s":
+        return shared_strings[int(value_text)]
+    if data_type in ("str", "inlineStr", "e"):
+        return value_text
+    if data_type == "b":
+        return value_text in ("1", "true")
+    if data_type == "d":
+        return value_text
+    value = _cast_number(value_text)
+    if style_index is not None:
+        style_id = int(style_index)
+        if style_id in parts.date_style_ids:
+            try:
+                return from_excel(value, parts.epoch, timedelta=style_id in parts.timedelta_style_ids)
+            except (OverflowError, ValueError):
+                return value
+    return value
+
+
+def load_sheet_store(file_path, sheet_name):
+    """單次串流解析工作表 XML，建立 SheetStore"""
+    parts = get_workbook_parts(file_path)
+    entry = parts.sheet_parts.get(sheet_name.lower())
+    if not entry:
+        raise ValueError(f"Worksheet '{sheet_name}' does not exist.")
+    actual_sheet_name, part_path = entry
+
+    shared_strings = get_shared_strings(file_path)
+    link_map = _external_link_map(parts)
+    store = SheetStore(file_path, actual_sheet_name)
+    formulas, values, resolved, array_refs = store.formulas, store.values, store.resolved, store.array_refs
+    max_row = max_col = 0
+
+    with zipfile.ZipFile(file_path) as zf:
+        for row, col, _, formula, array_ref, value_text, data_type, style_index in iter_sheet_cells(zf, part_path):
+            index = cell_index(row, col)
+            if formula is not None:
+                formulas[index] = formula
+                if array_ref is not None:
+                    array_refs[index] = array_ref
+                elif link_map and "[" in formula:
+                    resolved_formula = _resolve_formula_string(formula, link_map)
+                    if resolved_formula != formula:
+                        resolved[index] = resolved_formula
+            value = _convert_value(value_text, data_type, style_index, shared_strings, parts)
+            if value is not None:
+                values[index] = value
+            if row > max_row:
+                max_row = row
+            if col > max_col:
+                max_col = col
+
+    store.max_row = max_row
+    store.max_col = max_col
+    return store
+
+
+_shared_strings_cache = FingerprintLRUCache(
+    SHEET_STORE_MAX_BYTES // 4,
+    size_estimator=lambda file_path, strings: sum(len(s) for s in strings) * 2 + len(strings) * 56
+)
+
+def get_shared_strings(file_path):
+    """獲取快取的共用字串表"""
+    return _shared_strings_cache.get(
+        file_path, file_path,
+        lambda: _read_shared_strings(file_path, get_workbook_parts(file_path).shared_strings_part)
+    )
+
+
+_sheet_store_cache = FingerprintLRUCache(
+    SHEET_STORE_MAX_BYTES,
+    size_estimator=lambda file_path, store: len(store) * BYTES_PER_STORED_CELL
+)
+
+def get_sheet_store(file_path, sheet_name):
+    """獲取快取的 SheetStore；同一工作表只解析一次，檔案變更時自動重新解析"""
+    return _sheet_store_cache.get(
+        (file_path, sheet_name.lower()), file_path,
+        lambda: load_sheet_store(file_path, sheet_name)
+    )
+
+
+def set_sheet_store_cache_limit(max_bytes):
+    """調整工作表資料快取的記憶體上限（共用字串表另以其四分之一為上限），超出的項目立即淘汰"""
+    _sheet_store_cache.set_max_bytes(max_bytes)
+    _shared_strings_cache.set_max_bytes(max_bytes // 4)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 各模組直接放在專案根目錄（不是套件），測試以根目錄為匯入路徑
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,106 @@
+import random
+
+import pytest
+
+from dependency_graph import DependencyGraph, build_dependency_graph, node_key
+
+
+def _task(cell, sheet="S"):
+    return {"file": "book.xlsx", "sheet": sheet, "cell": cell}
+
+
+def _graph(edges):
+    """edges: {儲存格: [子儲存格, ...]}，子儲存格不在 edges 中表示尚未追蹤"""
+    graph = DependencyGraph()
+    for cell, children in edges.items():
+        graph.add_result(_task(cell), ([_task(child) for child in children], True, None, None))
+    return graph
+
+
+def _cells(keys):
+    return {key[2] for key in keys}
+
+
+def test_node_key_normalizes_sheet_and_address():
+    assert node_key(_task("$a$1", "Sheet1")) == node_key(_task("A1", "SHEET1"))
+
+
+def test_acyclic_graph_has_no_cyclic_nodes():
+    graph = _graph({"A1": ["B1", "C1"], "B1": ["C1"], "C1": []})
+    assert graph.cyclic_nodes == set()
+    assert sorted(len(component) for component in graph.strongly_connected_components()) == [1, 1, 1]
+
+
+def test_cycle_with_tail():
+    graph = _graph({"D1": ["A1"], "A1": ["B1"], "B1": ["C1"], "C1": ["A1", "E1"], "E1": []})
+    assert _cells(graph.cyclic_nodes) == {"A1", "B1", "C1"}
+
+
+def test_self_reference_is_cyclic():
+    graph = _graph({"A1": ["A1", "B1"], "B1": []})
+    assert _cells(graph.cyclic_nodes) == {"A1"}
+
+
+def test_untraced_children_are_ignored():
+    graph = _graph({"A1": ["B1", "Z9"], "B1": ["A1"]})
+    assert _cells(graph.cyclic_nodes) == {"A1", "B1"}
+
+
+def test_cyclic_nodes_refresh_after_add():
+    graph = _graph({"A1": ["B1"], "B1": []})
+    assert graph.cyclic_nodes == set()
+    graph.add_result(_task("B1"), ([_task("A1")], True, None, None))
+    assert _cells(graph.cyclic_nodes) == {"A1", "B1"}
+
+
+def test_deep_chain_and_deep_cycle_do_not_recurse():
+    depth = 20000
+    chain = {f"A{i}": [f"A{i + 1}"] for i in range(1, depth)}
+    chain[f"A{depth}"] = []
+    assert _graph(chain).cyclic_nodes == set()
+    chain[f"A{depth}"] = ["A1"]
+    components = _graph(chain).strongly_connected_components()
+    assert len(components) == 1 and len(components[0]) == depth
+
+
+def _reachable(edges, start):
+    seen = {start}
+    pending = [start]
+    while pending:
+        for child in edges[pending.pop()]:
+            if child in edges and child not in seen:
+                seen.add(child)
+                pending.append(child)
+    return seen
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_components_match_mutual_reachability(seed):
+    rng = random.Random(seed)
+    cells = [f"A{i}" for i in range(1, rng.randint(2, 40))]
+    edges = {cell: rng.sample(cells, rng.randint(0, 3)) for cell in cells}
+    graph = _graph(edges)
+    component_of = {}
+    for number, component in enumerate(graph.strongly_connected_components()):
+        for key in component:
+            component_of[key[2]] = number
+    assert set(component_of) == set(cells)
+    reach = {cell: _reachable(edges, cell) for cell in cells}
+    for a in cells:
+        for b in cells:
+            mutual = b in reach[a] and a in reach[b]
+            assert (component_of[a] == component_of[b]) == mutual
+
+
+def test_build_traces_each_node_once():
+    edges = {"A1": ["B1", "C1"], "B1": ["D1"], "C1": ["D1"], "D1": ["A1"]}
+    calls = []
+
+    def trace(task, working_path):
+        calls.append(task["cell"])
+        return [_task(child) for child in edges[task["cell"]]], True, None, None
+
+    graph = build_dependency_graph(_task("A1"), trace, ".")
+    assert sorted(calls) == ["A1", "B1", "C1", "D1"]
+    assert graph.roots == [node_key(_task("A1"))]
+    assert _cells(graph.cyclic_nodes) == {"A1", "B1", "C1", "D1"}
@@ -0,0 +1,62 @@
+import pytest
+from openpyxl.formula.translate import Translator
+from openpyxl.utils.cell import get_column_letter
+
+from formula_extractor import render_relative_formula, split_relative_formula
+
+FORMULAS = [
+    "=A1+B2*$C$3",
+    "=SUM(A1:B5)",
+    "=S1!B5+'My Sheet 2'!$A3",
+    '=LOG10(A5)+"A1 B2"&C4',
+    "=SUM(A:A)+SUM($B:C)+SUM(3:4)+SUM($5:6)",
+    "=[1]Sheet1!A1+[2]S0!$B$2",
+    '=IF(A2>0,VLOOKUP(A2,Data!$A$1:$D$100,2,FALSE),"x")',
+    "=_xlfn.STDEV.S(A1:A9)",
+    "='C:\\dir\\[Book1.xlsx]Sheet1'!A1*2",
+    "=-A$1+$A1",
+    '=INDIRECT("A"&ROW())',
+    "={1,2;3,4}+A1",
+    "=Sheet1:Sheet3!A1",
+    # 表格結構化引用的方括號內容不是儲存格位址
+    "=Table1[Col]+A1",
+    "=SUM(Sales[FY2024])*B2",
+    "=Sales[[#This Row],[Q1]]+C2",
+    "=SUM(Sales[[Q1]:[Q4]])/A2",
+    "=Sales[@Q1]*B2",
+    "=[1]S1!A1+Tbl[[#Totals],[FY2024]]",
+    "=T1[Q1 ''24]+A1",
+    "=SUMIFS(Sales[Q1],Sales[Region],A2)",
+]
+
+
+def _a1(row, col):
+    return f"{get_column_letter(col)}{row}"
+
+
+@pytest.mark.parametrize("formula", FORMULAS)
+@pytest.mark.parametrize("origin", [(2, 3), (10, 3)])
+def test_render_matches_openpyxl_translator(formula, origin):
+    pieces = split_relative_formula(formula, *origin)
+    assert render_relative_formula(pieces, *origin) == formula
+    for row_shift, col_shift in ((8, 0), (0, 2), (100, 1)):
+        row, col = origin[0] + row_shift, origin[1] + col_shift
+        expected = Translator(formula, origin=_a1(*origin)).translate_formula(_a1(row, col))
+        assert render_relative_formula(pieces, row, col) == expected
+
+
+def test_copies_share_one_template():
+    assert split_relative_formula("=A1+B$1+$C2", 1, 3) == split_relative_formula("=A5+B$1+$C6", 5, 3)
+    assert split_relative_formula("=A1", 1, 2) == split_relative_formula("=B1", 1, 3)
+    assert split_relative_formula("=A1", 1, 2) != split_relative_formula("=A1", 1, 3)
+
+
+def test_shift_off_the_sheet_becomes_ref_error():
+    pieces = split_relative_formula("=A1+$B$2", 2, 2)
+    assert render_relative_formula(pieces, 1, 1) == "=#REF!+$B$2"
+
+
+def test_names_beyond_the_sheet_are_literal():
+    # XFE 超出最大欄 XFD，是名稱而非引用
+    pieces = split_relative_formula("=XFE1+A1", 1, 1)
+    assert render_relative_formula(pieces, 3, 1) == "=XFE1+A3"
@@ -0,0 +1,103 @@
+import random
+
+import pytest
+
+from range_index import EXCEL_MAX_COL, EXCEL_MAX_ROW, RangeIntervalIndex, area_bounds
+
+
+@pytest.mark.parametrize("address, expected", [
+    ("A1", (1, 1, 1, 1)),
+    ("c3", (3, 3, 3, 3)),
+    ("$A$1:$B$3", (1, 1, 3, 2)),
+    ("B5:A1", (1, 1, 5, 2)),
+    ("A:A", (1, 1, EXCEL_MAX_ROW, 1)),
+    ("$C:B", (1, 2, EXCEL_MAX_ROW, 3)),
+    ("2:3", (2, 1, 3, EXCEL_MAX_COL)),
+])
+def test_area_bounds(address, expected):
+    assert area_bounds(address) == expected
+
+
+def test_area_bounds_rejects_non_references():
+    with pytest.raises(ValueError):
+        area_bounds("Table1[Col]")
+
+
+def _random_ranges(rng, count, max_row=300, max_col=12):
+    ranges = []
+    for _ in range(count):
+        min_row = rng.randint(1, max_row)
+        min_col = rng.randint(1, max_col)
+        shape = rng.random()
+        if shape < 0.05:
+            ranges.append((1, min_col, EXCEL_MAX_ROW, min_col))  # 整欄
+        elif shape < 0.1:
+            ranges.append((min_row, 1, min_row, EXCEL_MAX_COL))  # 整列
+        else:
+            ranges.append((min_row, min_col, min_row + rng.randint(0, 80), min_col + rng.randint(0, 4)))
+    return ranges
+
+
+def _contains(bounds, row, col):
+    return bounds[0] <= row <= bounds[2] and bounds[1] <= col <= bounds[3]
+
+
+def _build(ranges):
+    index = RangeIntervalIndex()
+    for bounds in ranges:
+        index.add("S", bounds)
+    return index
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_containing_matches_brute_force(seed):
+    rng = random.Random(seed)
+    ranges = list(dict.fromkeys(_random_ranges(rng, rng.randint(1, 200))))
+    index = _build(ranges)
+    for _ in range(200):
+        row, col = rng.randint(1, 400), rng.randint(1, 20)
+        expected = sorted(bounds for bounds in ranges if _contains(bounds, row, col))
+        assert sorted(index.containing("S", row, col)) == expected
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_intersecting_matches_brute_force(seed):
+    rng = random.Random(seed)
+    ranges = list(dict.fromkeys(_random_ranges(rng, rng.randint(1, 200))))
+    index = _build(ranges)
+    for _ in range(100):
+        top, left = rng.randint(1, 400), rng.randint(1, 20)
+        area = (top, left, top + rng.randint(0, 50), left + rng.randint(0, 3))
+        expected = sorted(
+            bounds for bounds in ranges
+            if bounds[0] <= area[2] and area[0] <= bounds[2] and bounds[1] <= area[3] and area[1] <= bounds[3]
+        )
+        assert sorted(index.intersecting("S", area)) == expected
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_containing_once_returns_each_range_on_first_contact(seed):
+    rng = random.Random(seed)
+    ranges = list(dict.fromkeys(_random_ranges(rng, rng.randint(1, 200))))
+    index = _build(ranges)
+    take = index.containing_once("S")
+    reported = set()
+    for _ in range(300):
+        row, col = rng.randint(1, 400), rng.randint(1, 20)
+        found = take(row, col)
+        expected = [bounds for bounds in index.containing("S", row, col) if bounds not in reported]
+        assert found == expected
+        reported.update(found)
+
+
+def test_duplicates_and_rebuild_after_add():
+    index = RangeIntervalIndex()
+    index.add("S", (1, 1, 10, 1))
+    index.add("S", (1, 1, 10, 1))
+    assert len(index) == 1
+    assert index.containing("S", 5, 1) == [(1, 1, 10, 1)]
+    index.add("S", (5, 1, 6, 2))
+    assert sorted(index.containing("S", 5, 1)) == [(1, 1, 10, 1), (5, 1, 6, 2)]
+    assert index.containing("S", 5, 3) == []
+    assert index.containing("other", 5, 1) == []
+    assert index.intersecting("other", (1, 1, 10, 10)) == []
@@ -0,0 +1,105 @@
+import datetime
+from types import SimpleNamespace
+
+import openpyxl
+import pytest
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900
+from openpyxl.worksheet.formula import ArrayFormula
+
+from sheet_store import _convert_value, cell_index, cell_position, get_sheet_store, load_sheet_store
+
+# 時間長度格式同時也是日期格式（與 _read_date_style_ids 相同）
+PARTS = SimpleNamespace(date_style_ids={1, 2}, timedelta_style_ids={2}, epoch=CALENDAR_WINDOWS_1900)
+
+
+@pytest.mark.parametrize("row, col", [(1, 1), (1, 16384), (1048576, 1), (1048576, 16384), (37, 702)])
+def test_cell_index_round_trip(row, col):
+    assert cell_position(cell_index(row, col)) == (row, col)
+
+
+def test_cell_index_orders_row_major():
+    assert cell_index(1, 16384) < cell_index(2, 1)
+
+
+@pytest.mark.parametrize("value_text, data_type, style_index, expected", [
+    (None, None, None, None),
+    ("1", "s", None, "second"),
+    ("plain", "str", None, "plain"),
+    ("inline", "inlineStr", None, "inline"),
+    ("#N/A", "e", None, "#N/A"),
+    ("1", "b", None, True),
+    ("0", "b", None, False),
+    ("2024-01-01T00:00:00", "d", None, "2024-01-01T00:00:00"),
+    ("42", None, None, 42),
+    ("1.5", None, None, 1.5),
+    ("1E3", None, None, 1000.0),
+    ("42", None, "0", 42),
+    ("45292", None, "1", datetime.datetime(2024, 1, 1)),
+    ("1.5", None, "2", datetime.timedelta(days=1.5)),
+    ("1E20", None, "1", 1e20),  # 超出日期範圍時保留數值
+])
+def test_convert_value(value_text, data_type, style_index, expected):
+    value = _convert_value(value_text, data_type, style_index, ["first", "second"], PARTS)
+    assert value == expected
+    assert type(value) is type(expected)
+
+
+def test_convert_value_uses_workbook_epoch():
+    parts = SimpleNamespace(date_style_ids={1}, timedelta_style_ids=set(), epoch=CALENDAR_MAC_1904)
+    assert _convert_value("1", None, "1", [], parts) == datetime.datetime(1904, 1, 2)
+
+
+def _save_workbook(path):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Data"
+    ws["A1"] = 3
+    ws["A2"] = 4.25
+    ws["A3"] = "text"
+    ws["A4"] = True
+    ws["A5"] = datetime.datetime(2024, 3, 1)
+    ws["B1"] = "=SUM(A1:A2)"
+    ws["B2"] = ArrayFormula("B2:B3", "=A1:A2*2")
+    ws["D100"] = "far"
+    wb.save(path)
+
+
+def test_load_sheet_store_matches_openpyxl(tmp_path):
+    path = str(tmp_path / "book.xlsx")
+    _save_workbook(path)
+    store = load_sheet_store(path, "data")
+    ws = openpyxl.load_workbook(path)["Data"]
+
+    assert store.name == "Data"
+    assert (store.max_row, store.max_col) == (ws.max_row, ws.max_column)
+    for row in ws.iter_rows():
+        for cell in row:
+            content = store.content(cell.row, cell.column)
+            if isinstance(cell.value, ArrayFormula):
+                assert isinstance(content, ArrayFormula)
+                assert (content.ref, content.text) == (cell.value.ref, cell.value.text)
+            else:
+                assert content == cell.value
+    assert store.formula(1, 2) == "=SUM(A1:A2)"
+    assert store.range_bounds("A:A") == (1, 1, 100, 1)
+
+
+def test_missing_sheet_raises(tmp_path):
+    path = str(tmp_path / "book.xlsx")
+    _save_workbook(path)
+    with pytest.raises(ValueError):
+        load_sheet_store(path, "Nope")
+
+
+def test_sheet_store_cache_reloads_changed_file(tmp_path):
+    path = str(tmp_path / "book.xlsx")
+    _save_workbook(path)
+    first = get_sheet_store(path, "Data")
+    assert get_sheet_store(path, "DATA") is first
+
+    wb = openpyxl.load_workbook(path)
+    wb["Data"]["A1"] = "changed value"
+    wb.save(path)
+    second = get_sheet_store(path, "Data")
+    assert second is not first
+    assert second.cached_value(1, 1) == "changed value"
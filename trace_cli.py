@@ -0,0 +1,195 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+# 命令列入口：python trace_cli.py FILE SHEET!CELL [--format text|json] [--workers N]（N 個行程平行追蹤各活頁簿）
+#          或 python trace_cli.py FILE --full-scan [--workers N]（整本活頁簿所有公式的依賴圖）
+# 加上 --ranges-containing SHEET!CELL 時改為列出結果中涵蓋該儲存格的範圍引用（例如 SUM(A:A)）。
+#          或 python trace_cli.py FILE --dependents SHEET!CELL（反向：受該儲存格 / 範圍影響的所有下游儲存格）
+# 只匯入追蹤引擎（不需要 tkinter / pywin32 / Excel），可在 Linux 批次伺服器上執行。
+# 引擎在解析參數後才匯入，--help 與參數錯誤時不必載入 openpyxl。
+
+
+def parse_location(location):
+    """
+    把 SHEET!CELL 拆成 (工作表, 位址)。工作表名稱可加單引號（'My Sheet'!A1，名稱內的 '' 表示 '），
+    位址可為儲存格或範圍（A1 / $A$1 / A1:B3）。
+    """
+    sheet, separator, cell = location.rpartition("!")
+    if not separator or not sheet or not cell:
+        raise ValueError(f"Invalid location '{location}', expected SHEET!CELL.")
+    if len(sheet) >= 2 and sheet[0] == "'" and sheet[-1] == "'":
+        sheet = sheet[1:-1].replace("''", "'")
+    return sheet, cell.replace("$", "").upper()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="trace",
+        description="Trace the precedents of an Excel cell without the GUI."
+    )
+    parser.add_argument("file", help="workbook path (.xlsx / .xlsm)")
+    parser.add_argument("location", nargs="?", help="SHEET!CELL, e.g. Sheet1!B4 or 'My Sheet'!A1")
+    parser.add_argument("--format", choices=("text", "json"), default="text", help="output format (default: text)")
+    parser.add_argument("--display-mode", choices=("simple", "detail", "fullpath"), default="simple",
+                        help="node headers in text output (default: simple)")
+    parser.add_argument("--empty-lines", action="store_true", help="add an empty line between text output lines")
+    parser.add_argument("--working-path", help="folder used to resolve external links (default: the workbook's folder)")
+    parser.add_argument("--frontier", action="store_true",
+                        help="trace breadth-first, grouping cells of the same sheet")
+    parser.add_argument("--full-scan", action="store_true",
+                        help="build the dependency graph of every formula cell in the workbook instead of one cell")
+    parser.add_argument("--sheet", action="append", dest="sheets", metavar="SHEET",
+                        help="with --full-scan, only scan this sheet (repeatable)")
+    parser.add_argument("--workers", type=int,
+                        help="number of worker processes; with SHEET!CELL, trace linked workbooks in parallel "
+                             "(default: single process), with --full-scan, scan sheets in parallel (default: CPU count)")
+    parser.add_argument("--ranges-containing", metavar="SHEET!CELL",
+                        help="instead of the trace, list the range references in the result that contain this cell of FILE")
+    parser.add_argument("--dependents", metavar="SHEET!CELL",
+                        help="instead of tracing precedents, list every cell downstream of this cell or range of FILE, "
+                             "across the workbooks linked to it in the working path")
+    parser.add_argument("-o", "--output", help="write the output to this file instead of stdout")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.dependents:
+        if args.location or args.full_scan or args.ranges_containing:
+            parser.error("--dependents cannot be combined with SHEET!CELL, --full-scan or --ranges-containing.")
+        try:
+            dependents_sheet, dependents_address = parse_location(args.dependents)
+        except ValueError as e:
+            parser.error(str(e))
+    elif args.full_scan:
+        if args.location:
+            parser.error("SHEET!CELL cannot be combined with --full-scan.")
+    elif not args.location:
+        parser.error("SHEET!CELL is required unless --full-scan or --dependents is given.")
+    else:
+        try:
+            sheet, cell = parse_location(args.location)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.frontier and args.workers:
+            parser.error("--frontier cannot be combined with --workers.")
+    file_path = os.path.abspath(args.file)
+    if not os.path.isfile(file_path):
+        parser.error(f"File not found: {args.file}")
+    working_path = os.path.abspath(args.working_path) if args.working_path else os.path.dirname(file_path)
+    if args.ranges_containing:
+        try:
+            query_sheet, query_cell = parse_location(args.ranges_containing)
+        except ValueError as e:
+            parser.error(str(e))
+        if ":" in query_cell:
+            parser.error("--ranges-containing expects a single cell.")
+        args.query_task = {"file": file_path, "sheet": query_sheet, "cell": query_cell}
+
+    if args.dependents:
+        return _dependents(args, file_path, working_path, dependents_sheet, dependents_address)
+    if args.full_scan:
+        return _full_scan(args, file_path, working_path)
+
+    from dependency_engine import trace_task, trace_tasks
+    from trace_renderers import render_text, export_json
+
+    task = {"file": file_path, "sheet": sheet, "cell": cell}
+    if args.workers:
+        from parallel_trace import trace_tasks_parallel
+        result = trace_tasks_parallel([task], working_path=working_path, max_workers=args.workers)[0]
+    elif args.frontier:
+        result = trace_tasks([task], working_path=working_path, frontier=True)[0]
+    else:
+        result = trace_task(task, working_path=working_path)
+
+    if args.ranges_containing:
+        text = _format_ranges_containing(args, result)
+    elif args.format == "json":
+        text = export_json(result)
+    else:
+        text = render_text(result, task, args.display_mode, args.empty_lines)
+    _write_output(args, text)
+
+    root = result.node(task)
+    return 1 if root is not None and root.kind == "error" else 0
+
+
+def _full_scan(args, file_path, working_path):
+    from workbook_scan import scan_workbook, summarize_scan
+    from compact_graph import CompactGraph
+    from trace_renderers import export_json
+
+    started = time.monotonic()
+    result = scan_workbook(file_path, working_path, args.workers, args.sheets, graph=CompactGraph())
+    elapsed = time.monotonic() - started
+    if args.ranges_containing:
+        text = _format_ranges_containing(args, result)
+    elif args.format == "json":
+        text = export_json(result)
+    else:
+        formula_count, edge_count, sheet_count, cyclic_count = summarize_scan(result)
+        text = (f"{os.path.basename(file_path)}: {formula_count} formula cells on {sheet_count} sheets, "
+                f"{edge_count} references, {cyclic_count} cells in circular references ({elapsed:.1f}s)")
+    _write_output(args, text)
+    return 0
+
+
+def _dependents(args, file_path, working_path, sheet, address):
+    from formula_extractor import get_workbook_parts
+    from reverse_index import impact_analysis
+    from trace_renderers import format_header
+
+    actual_sheet = get_workbook_parts(file_path).resolve_sheet_name(sheet)
+    if actual_sheet is None:
+        print(f"Worksheet '{sheet}' does not exist.", file=sys.stderr)
+        return 1
+    tasks = impact_analysis(file_path, actual_sheet, address, working_path)
+    if args.format == "json":
+        text = json.dumps(tasks, ensure_ascii=False, indent=2)
+    elif not tasks:
+        text = f"No formula cell depends on {args.dependents}."
+    else:
+        text = "\n".join(format_header(task, None, args.display_mode) for task in tasks)
+    _write_output(args, text)
+    return 0
+
+
+def _format_ranges_containing(args, result):
+    """結果中涵蓋查詢儲存格的範圍節點：text 每行一個範圍（已追蹤的附上範圍摘要），json 為任務列表"""
+    from trace_renderers import format_header
+
+    matches = []
+    for key in result.ranges_containing(args.query_task):
+        node = result.node(key)
+        task = node.task if node is not None else {"file": key[0], "sheet": key[1], "cell": key[2]}
+        matches.append((task, node.characteristic if node is not None else None))
+    if args.format == "json":
+        return json.dumps([dict(task, characteristic=characteristic) for task, characteristic in matches],
+                          ensure_ascii=False, indent=2)
+    if not matches:
+        return f"No range reference in the result contains {args.ranges_containing}."
+    return "\n".join(
+        format_header(task, None, args.display_mode) + (f" {characteristic}" if characteristic else "")
+        for task, characteristic in matches
+    )
+
+
+def _write_output(args, text):
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        # Windows 主控台預設編碼可能無法輸出 emoji 與樹狀符號；被替換成 StringIO 等物件時沒有 reconfigure
+        reconfigure = getattr(sys.stdout, "reconfigure", None)
+        if reconfigure is not None:
+            reconfigure(encoding="utf-8")
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
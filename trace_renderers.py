@@ -0,0 +1,188 @@
+import os
+import re
+import json
+
+# 超過此深度的節點不再增加縮排，改以 [L深度] 標示，避免深層鏈的輸出隨深度平方增長
+MAX_TREE_INDENT_DEPTH = 100
+
+_MID_GUIDE = "│    "
+_LAST_GUIDE = "     "
+
+
+def format_header(task, parent_context, display_mode):
+    """依顯示模式產生節點標題"""
+    if display_mode == "simple":
+        if parent_context and task['file'] == parent_context['file']:
+            if task['sheet'].lower() == parent_context['sheet'].lower():
+                return task['cell']
+            return f"{task['sheet']}!{task['cell']}"
+        return f"[{os.path.basename(task['file'])}]{task['sheet']}!{task['cell']}"
+    if display_mode == "detail":
+        return f"[{os.path.basename(task['file'])}]{task['sheet']}!{task['cell']}"
+    if display_mode == "fullpath":
+        return f"{task['file']}|{task['sheet']}!{task['cell']}"
+    raise ValueError(f"Unknown display mode '{display_mode}'.")
+
+
+def _format_value(value):
+    if isinstance(value, str):
+        return f"'{value}'"
+    return str(value)
+
+
+def tree_line_prefix(depth, is_last, guides, base_prefix="", child_base_prefix=""):
+    """
+    樹狀節點的行首：guides 為各層祖先（不含根）是否為最後一個子節點；
+    超過 MAX_TREE_INDENT_DEPTH 的深度只保留最近的縮排並加上 [L深度]。
+    """
+    if depth == 0:
+        return base_prefix
+    depth_marker = ""
+    if depth > MAX_TREE_INDENT_DEPTH:
+        guides = guides[-MAX_TREE_INDENT_DEPTH:]
+        depth_marker = f"[L{depth}] "
+    guide_str = "".join(f"{_LAST_GUIDE} " if last else f"{_MID_GUIDE} " for last in guides)
+    return child_base_prefix + depth_marker + guide_str + ("└─ " if is_last else "├─ ")
+
+
+def entry_lines(result, entry, line_prefix, display_mode="simple"):
+    """單一 TreeEntry 的輸出行 [(行文字, 行類型)]"""
+    task = entry.task
+    if entry.circular:
+        return [(f"{line_prefix}📍 Circular reference to [{os.path.basename(task['file'])}]{task['sheet']}!{task['cell']} detected, stopping expansion.",
+                 "circular")]
+
+    node = result.nodes.get(entry.key)
+    header = format_header(task, entry.parent_task, display_mode)
+
+    if node is None:
+        # 部分結果（掃描進行中或尚未展開）中還沒追蹤的節點
+        return [(f"{line_prefix}📍 {header}: ⏳ Pending...", "pending")]
+    if node.kind == "range":
+        return [(f"{line_prefix}📍 {header}", "header"),
+                (f"{line_prefix}🔷 Characteristic: {node.content}", "characteristic")]
+    if not node.is_formula:
+        # 非公式儲存格：顯示標題和實際值
+        if node.actual_value is not None:
+            return [(f"{line_prefix}📍 {header}: {_format_value(node.actual_value)}", "value")]
+        return [(f"{line_prefix}📍 {header}: {node.content}", "value")]
+    # 公式儲存格：顯示標題、公式和計算結果
+    if node.actual_value is not None:
+        result_line = f"{line_prefix}📊 Result: {_format_value(node.actual_value)}"
+    else:
+        result_line = f"{line_prefix}📊 Result: [Unable to calculate]"
+    return [(f"{line_prefix}📍 {header}", "header"),
+            (f"{line_prefix}⚙️ Formula: {node.content}", "formula"),
+            (result_line, "result")]
+
+
+def entry_line_count(result, entry):
+    """entry_lines 會產生的行數（不必實際組出文字）"""
+    if entry.circular:
+        return 1
+    node = result.nodes.get(entry.key)
+    if node is None:
+        return 1
+    if node.kind == "range":
+        return 2
+    return 3 if node.is_formula else 1
+
+
+def iter_text_lines(result, root_task=None, display_mode="simple", prefix="", parent_context=None):
+    """
+    把 TraceResult 轉成樹狀文字，逐行產生 (行文字, 行類型, TreeEntry)。
+    行類型：header / value / formula / result / characteristic / circular / pending。
+    """
+    child_base_prefix = prefix.replace("├─", _MID_GUIDE).replace("└─", _LAST_GUIDE)
+    ancestor_is_last = []
+
+    for entry in result.walk(root_task, parent_context):
+        depth = entry.depth
+        del ancestor_is_last[depth:]
+        ancestor_is_last.append(entry.is_last)
+        line_prefix = tree_line_prefix(depth, entry.is_last, ancestor_is_last[1:depth], prefix, child_base_prefix)
+        for line, kind in entry_lines(result, entry, line_prefix, display_mode):
+            yield line, kind, entry
+
+
+def render_text(result, root_task=None, display_mode="simple", add_empty_lines=False, prefix=""):
+    """文字輸出；add_empty_lines 時每行之間加一個空行"""
+    lines = [line for line, _, _ in iter_text_lines(result, root_task, display_mode, prefix)]
+    if add_empty_lines:
+        return "\n\n".join(line for line in lines if line.strip()).strip()
+    return "\n".join(lines)
+
+
+_EXTERNAL_REF_RE = re.compile(r"'(?:.*?\\)?\[.*?\][^']+'![\w$:]+")
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*?'")
+_DIMENSION_RE = re.compile(r"\[\d+R x \d+C\]")
+_SUM_RE = re.compile(r"\[Sum: [\d,.]+(?:\.\d+)?\]")
+_HASH_RE = re.compile(r"\[Hash: [0-9a-fA-F]{8}\.\.\.\]")
+_TEXT_OR_ERRORS_RE = re.compile(r"\[Text\]|\[Errors: \d+\]")
+
+_NODE_MARKER = "📍 "
+_FORMULA_MARKER = "⚙️ Formula: "
+_RESULT_MARKER = "📊 Result: "
+_CHARACTERISTIC_MARKER = "🔷 Characteristic: "
+_ERROR_MARKER = "❌ Error during analysis: "
+
+
+def _is_literal(text):
+    return len(text) >= 2 and text[0] == "'" and text[-1] == "'"
+
+
+def line_tags(line, kind):
+    """單行的標記範圍 [(tag, 起始欄, 結束欄)]，欄位以字元計算；每行只掃描一次"""
+    tags = []
+    if kind == "circular":
+        start = line.find(_NODE_MARKER)
+        tags.append(("circular_ref", start, len(line)))
+        return tags
+
+    if kind in ("header", "value", "pending"):
+        start = line.find(_NODE_MARKER) + len(_NODE_MARKER)
+        separator = line.find(": ", start) if kind != "header" else -1
+        tags.append(("header_info", start, separator if separator != -1 else len(line)))
+        if separator != -1:
+            value_start = separator + 2
+            value_text = line[value_start:]
+            if _is_literal(value_text):
+                tags.append(("literal_value", value_start, len(line)))
+    elif kind == "result":
+        value_start = line.find(_RESULT_MARKER) + len(_RESULT_MARKER)
+        if _is_literal(line[value_start:]):
+            tags.append(("literal_value", value_start, len(line)))
+    elif kind == "formula":
+        content_start = line.find(_FORMULA_MARKER) + len(_FORMULA_MARKER)
+        content = line[content_start:]
+        if content.startswith("="):
+            tags.append(("formula_display", content_start, len(line)))
+        external_refs = list(_EXTERNAL_REF_RE.finditer(content))
+        for match in external_refs:
+            tags.append(("external_ref", content_start + match.start(), content_start + match.end()))
+        if not external_refs:
+            for match in _LITERAL_RE.finditer(content):
+                tags.append(("literal_value", content_start + match.start(), content_start + match.end()))
+    elif kind == "characteristic":
+        content_start = line.find(_CHARACTERISTIC_MARKER) + len(_CHARACTERISTIC_MARKER)
+        content = line[content_start:]
+        tags.append(("characteristic_info", content_start, len(line)))
+        for pattern, tag in ((_DIMENSION_RE, "header_info"), (_SUM_RE, "sum_info"),
+                             (_HASH_RE, "hash_info"), (_TEXT_OR_ERRORS_RE, "characteristic_info")):
+            match = pattern.search(content)
+            if match:
+                tags.append((tag, content_start + match.start(), content_start + match.end()))
+
+    error_start = line.find(_ERROR_MARKER)
+    if error_start != -1:
+        tags.append(("error_highlight", error_start, len(line)))
+    return tags
+
+
+def export_json(result, file_path=None, indent=2):
+    """匯出 JSON；指定 file_path 時寫入檔案，否則返回字串"""
+    text = json.dumps(result.to_dict(), ensure_ascii=False, indent=indent, default=str)
+    if file_path:
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(text)
+    return text
@@ -0,0 +1,224 @@
+from dependency_graph import node_key
+from range_index import RangeIntervalIndex, area_bounds
+
+
+class TraceNode:
+    """單一儲存格 / 範圍的追蹤結果"""
+    __slots__ = ("task", "is_formula", "content", "actual_value")
+
+    def __init__(self, task, is_formula, content, actual_value):
+        self.task = task
+        self.is_formula = is_formula
+        self.content = content
+        self.actual_value = actual_value
+
+    @property
+    def kind(self):
+        """formula / range / error / value"""
+        if self.is_formula:
+            return "formula"
+        if isinstance(self.content, str):
+            if self.content.startswith("["):
+                return "range"
+            if self.content.startswith("❌"):
+                return "error"
+        return "value"
+
+    @property
+    def formula(self):
+        return self.content if self.is_formula else None
+
+    @property
+    def characteristic(self):
+        """範圍的 [維度] [Sum/Errors/Text] [Hash] 摘要"""
+        return self.content if self.kind == "range" else None
+
+    @property
+    def value(self):
+        return self.actual_value
+
+
+class TreeEntry:
+    """樹狀走訪時的一個位置；同一節點在不同路徑下會產生多個 TreeEntry"""
+    __slots__ = ("depth", "is_last", "task", "parent_task", "key", "circular")
+
+    def __init__(self, depth, is_last, task, parent_task, key, circular):
+        self.depth = depth
+        self.is_last = is_last
+        self.task = task
+        self.parent_task = parent_task
+        self.key = key
+        self.circular = circular
+
+
+class TraceResult:
+    """
+    追蹤結果：節點、依公式順序排列的邊、根節點與循環節點。
+    文字、GUI、JSON 匯出等輸出都直接讀取此物件，不再經由 print 擷取與正規表示式還原結構。
+    """
+
+    def __init__(self, nodes, edges, roots, cyclic_nodes):
+        self.nodes = nodes                # key -> TraceNode
+        self.edges = edges                # key -> 依公式順序排列的子任務列表
+        self.roots = roots                # 根節點 key 列表
+        self.cyclic_nodes = cyclic_nodes  # 位於循環中的 key 集合
+        self._range_index = None          # (節點數, RangeIntervalIndex, {(工作表鍵, 邊界): [key]})，查詢時才建立
+
+    @classmethod
+    def from_graph(cls, graph):
+        nodes = {}
+        for key, (_, is_formula, content, actual_value) in graph.results.items():
+            nodes[key] = TraceNode(graph.tasks[key], is_formula, content, actual_value)
+        return cls(nodes, dict(graph.edges), list(graph.roots), set(graph.cyclic_nodes))
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, key):
+        return key in self.nodes
+
+    def node(self, task_or_key):
+        key = node_key(task_or_key) if isinstance(task_or_key, dict) else task_or_key
+        return self.nodes.get(key)
+
+    def children(self, key):
+        return self.edges.get(key, [])
+
+    @property
+    def root_tasks(self):
+        return [self.nodes[key].task for key in self.roots if key in self.nodes]
+
+    def for_root(self, root_task):
+        """
+        只以 root_task 為根的結果。節點、邊與循環集合直接共用（不複製），
+        批次追蹤時每個根的結果都是同一張圖上的視圖，建立成本為常數。
+        """
+        return TraceResult(self.nodes, self.edges, [node_key(root_task)], self.cyclic_nodes)
+
+    def _build_range_index(self):
+        index = RangeIntervalIndex()
+        range_keys = {}
+        seen = set()
+        for key in self.nodes:
+            for candidate in [key] + [node_key(child) for child in self.children(key)]:
+                if ":" not in candidate[2] or candidate in seen:
+                    continue
+                seen.add(candidate)
+                try:
+                    bounds = area_bounds(candidate[2])
+                except ValueError:
+                    continue
+                index.add(candidate[:2], bounds)
+                range_keys.setdefault((candidate[:2], bounds), []).append(candidate)
+        # 按需追蹤會就地加入節點，節點數改變時重新建立
+        self._range_index = (len(self.nodes), index, range_keys)
+
+    def ranges_containing(self, task_or_key):
+        """
+        包含指定儲存格的範圍節點 key（含已引用但尚未追蹤的範圍），與 CompactGraph.ranges_containing 相同：
+        以每個工作表的區間索引查詢，不展開範圍內的儲存格；位址不是單一儲存格時返回空列表。
+        """
+        key = node_key(task_or_key) if isinstance(task_or_key, dict) else task_or_key
+        if ":" in key[2]:
+            return []
+        try:
+            row, col, _, _ = area_bounds(key[2])
+        except ValueError:
+            return []
+        if self._range_index is None or self._range_index[0] != len(self.nodes):
+            self._build_range_index()
+        _, index, range_keys = self._range_index
+        found = []
+        for bounds in index.containing(key[:2], row, col):
+            found.extend(range_keys[(key[:2], bounds)])
+        return found
+
+    def reachable_keys(self):
+        """從所有根節點可到達的節點 key，依第一次遇到的順序排列"""
+        seen = set()
+        ordered = []
+        stack = list(reversed(self.roots))
+        while stack:
+            key = stack.pop()
+            if key in seen or key not in self.nodes:
+                continue
+            seen.add(key)
+            ordered.append(key)
+            children = self.edges.get(key, [])
+            for i in range(len(children) - 1, -1, -1):
+                child_key = node_key(children[i])
+                if child_key not in seen:
+                    stack.append(child_key)
+        return ordered
+
+    def walk(self, root_task=None, parent_task=None):
+        """
+        以顯式堆疊依前序走訪樹狀結構，逐一產生 TreeEntry。
+        已在目前路徑上的循環節點會產生 circular=True 的項目並停止展開。
+        """
+        if root_task is None:
+            root_task = self.root_tasks[0]
+        current_path = set()
+        # 堆疊項目：("enter", task, depth, is_last, parent_task) 或 ("exit", key)
+        stack = [("enter", root_task, 0, True, parent_task)]
+        while stack:
+            frame = stack.pop()
+            if frame[0] == "exit":
+                current_path.discard(frame[1])
+                continue
+            _, task, depth, is_last, parent = frame
+            key = node_key(task)
+
+            if key in current_path:
+                yield TreeEntry(depth, is_last, task, parent, key, True)
+                continue
+            if key in self.cyclic_nodes:
+                current_path.add(key)
+                stack.append(("exit", key))
+
+            yield TreeEntry(depth, is_last, task, parent, key, False)
+
+            children = self.children(key) if key in self.nodes else []
+            for i in range(len(children) - 1, -1, -1):
+                stack.append(("enter", children[i], depth + 1, i == len(children) - 1, task))
+
+    def unique_tasks(self, root_task=None):
+        """依樹狀輸出順序列出不重複的任務（對應 final_dependency_map）"""
+        seen = set()
+        ordered = []
+        for entry in self.walk(root_task):
+            if not entry.circular and entry.key not in seen:
+                seen.add(entry.key)
+                ordered.append(entry.task)
+        return ordered
+
+    def to_dict(self):
+        """可序列化為 JSON 的結構：節點列表與以索引表示的邊（只包含從根節點可到達的節點）"""
+        keys = self.reachable_keys()
+        index_of = {key: i for i, key in enumerate(keys)}
+        nodes = []
+        for key in keys:
+            node = self.nodes[key]
+            nodes.append({
+                "id": index_of[key],
+                "file": node.task["file"],
+                "sheet": node.task["sheet"],
+                "cell": node.task["cell"],
+                "kind": node.kind,
+                "formula": node.formula,
+                "value": node.actual_value,
+                "characteristic": node.characteristic,
+                "content": node.content,
+            })
+        edges = []
+        for key in keys:
+            for child in self.edges.get(key, []):
+                child_index = index_of.get(node_key(child))
+                if child_index is not None:
+                    edges.append([index_of[key], child_index])
+        return {
+            "roots": [index_of[key] for key in self.roots if key in index_of],
+            "nodes": nodes,
+            "edges": edges,
+            "cycles": sorted(index_of[key] for key in self.cyclic_nodes if key in index_of),
+        }
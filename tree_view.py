@@ -0,0 +1,415 @@
+import tkinter as tk
+import tkinter.font as tkfont
+from bisect import bisect_right
+
+from trace_result import TreeEntry
+from dependency_graph import node_key
+from trace_renderers import MAX_TREE_INDENT_DEPTH, tree_line_prefix, entry_lines, entry_line_count, line_tags
+
+# 虛擬化的樹狀輸出：只組出視窗內可見的行與行號，收合的子樹在展開前不會走訪。
+
+# 收合節點在第一行後加上的標記，例如 " [+3]"
+COLLAPSED_MARKER = " [+{count}]"
+# 可見行數之外多組出的行數（自動換行時補足視窗底部）
+OVERSCAN_LINES = 2
+
+
+class _Subtree:
+    """
+    一個節點在某種展開狀態下的可見子樹：自身行數、子樹總行數與各子樹的起始行（相對於本節點）。
+    不在循環中的節點，子樹只取決於 (key, 剩餘自動展開深度)，所有路徑共用同一個 _Subtree；
+    循環節點的子節點若也在循環中，是否標記為 circular 取決於路徑，改為每個位置各自一個。
+    """
+    __slots__ = ("key", "remaining", "circular", "on_cycle", "line_count", "tasks", "children",
+                 "starts", "total", "parents")
+
+    def __init__(self, key, remaining, circular, on_cycle, line_count):
+        self.key = key
+        self.remaining = remaining    # 剩餘的自動展開深度（None 表示不限）
+        self.circular = circular
+        self.on_cycle = on_cycle      # 位於循環中，走訪子樹時加入目前路徑
+        self.line_count = line_count
+        self.tasks = ()               # 子節點任務（與 children 一一對應）
+        self.children = None          # 可見的子 _Subtree；None 表示尚未建立，[] 表示收合或沒有子節點
+        self.starts = []              # starts[i] 為 children[i] 的第一行（相對於本節點）
+        self.total = None             # 子樹可見行數；None 表示需要重新計算
+        self.parents = set()          # 使用本子樹的上層 _Subtree，展開 / 收合時往上標記需重新計算
+
+    @property
+    def expanded(self):
+        return bool(self.children)
+
+
+class TreeRow:
+    """樹狀結構中一個可見位置（同一節點在不同路徑下是不同的 TreeRow）；只為視窗內的行建立"""
+    __slots__ = ("entry", "parent", "guides", "subtree", "index")
+
+    def __init__(self, entry, parent, guides, subtree, index):
+        self.entry = entry
+        self.parent = parent
+        self.guides = guides  # 各層祖先（不含根）是否為最後一個子節點
+        self.subtree = subtree
+        self.index = index    # 在父節點子節點中的位置
+
+    @property
+    def expanded(self):
+        return self.subtree.expanded
+
+    @property
+    def line_count(self):
+        return self.subtree.line_count
+
+
+class TreeRows:
+    """
+    TraceResult 的可見行模型（不依賴 Tk）。
+    每個節點記錄展開後子樹的可見行數（在 DAG 上記憶化，菱形引用不會隨路徑數量倍增），
+    由行號找節點時從根依各子樹行數往下走，只為視窗內的行建立 TreeRow，組出行文字時才呼叫 entry_lines。
+    展開 / 收合只讓該節點與其上層的子樹行數重新計算。
+    展開狀態以節點 key 記錄：expand_depth 為初始展開的深度（None 表示全部展開）；collapsed_keys / expanded_keys
+    中的節點初始為收合 / 展開，展開與收合時會更新這兩個集合，重新建立時傳入即可保留狀態。
+    """
+
+    def __init__(self, result, root_task=None, display_mode="simple", add_empty_lines=False,
+                 expand_depth=None, collapsed_keys=None, expanded_keys=None):
+        self.result = result
+        self.display_mode = display_mode
+        self.add_empty_lines = add_empty_lines
+        self.expand_depth = expand_depth
+        self.collapsed_keys = set(collapsed_keys or ())
+        self.expanded_keys = set(expanded_keys or ())
+        if root_task is None:
+            root_task = result.root_tasks[0]
+        self.root_task = root_task
+        self._reset()
+
+    def _reset(self):
+        self._shared = {}   # (key, 剩餘展開深度) -> 不在循環路徑上的共用 _Subtree
+        self._by_key = {}   # key -> 該節點的所有 _Subtree（展開 / 收合時找出需要重建的子樹）
+        root_key = node_key(self.root_task)
+        self._root = self._subtree(root_key, self.expand_depth, False, None)
+        self.root = TreeRow(TreeEntry(0, True, self.root_task, None, root_key, False), None, (), self._root, 0)
+
+    # --- 結構 ---
+
+    def _subtree(self, key, remaining, circular, path):
+        """path 為 None 表示子樹與祖先無關（可共用）；否則為目前路徑上的循環節點"""
+        if circular:
+            return _Subtree(key, remaining, True, False, 1)
+        if path is None:
+            subtree = self._shared.get((key, remaining))
+            if subtree is not None:
+                return subtree
+        line_count = entry_line_count(self.result, TreeEntry(0, True, None, None, key, False))
+        subtree = _Subtree(key, remaining, False, key in self.result.cyclic_nodes, line_count)
+        if path is None:
+            self._shared[(key, remaining)] = subtree
+        self._by_key.setdefault(key, []).append(subtree)
+        return subtree
+
+    def _child_tasks(self, row):
+        entry = row.entry
+        if entry.circular or entry.key not in self.result.nodes:
+            return []
+        return self.result.children(entry.key)
+
+    def has_children(self, row):
+        return bool(self._child_tasks(row))
+
+    def _auto_expand(self, subtree):
+        if subtree.key in self.collapsed_keys:
+            return False
+        if subtree.key in self.expanded_keys:
+            return True
+        return subtree.remaining is None or subtree.remaining > 0
+
+    def _build_children(self, subtree, path):
+        """建立 subtree 可見的子節點；path 已包含 subtree 本身（若在循環中）"""
+        if subtree.circular or subtree.key not in self.result.nodes or not self._auto_expand(subtree):
+            subtree.tasks, subtree.children = (), []
+            return
+        tasks = self.result.children(subtree.key)
+        remaining = None if subtree.remaining is None else max(subtree.remaining - 1, 0)
+        # 不在循環中的節點，其子孫不可能回到祖先，子節點可共用
+        child_path = path if subtree.on_cycle else None
+        children = []
+        for task in tasks:
+            key = node_key(task)
+            child = self._subtree(key, remaining, child_path is not None and key in child_path,
+                                  child_path if child_path is not None and key in self.result.cyclic_nodes else None)
+            child.parents.add(subtree)
+            children.append(child)
+        subtree.tasks, subtree.children = tasks, children
+
+    def _update(self):
+        """重新計算標記過的子樹行數（以顯式堆疊後序走訪，只進入需要重新計算的子樹）"""
+        if self._root.total is not None:
+            return
+        path = set()
+        stack = [(self._root, False)]
+        while stack:
+            subtree, finished = stack.pop()
+            if finished:
+                line = subtree.line_count
+                starts = []
+                for child in subtree.children:
+                    starts.append(line)
+                    line += child.total
+                subtree.starts = starts
+                subtree.total = line
+                if subtree.on_cycle:
+                    path.discard(subtree.key)
+                continue
+            if subtree.total is not None:
+                continue
+            if subtree.on_cycle:
+                path.add(subtree.key)
+            if subtree.children is None:
+                self._build_children(subtree, path)
+            stack.append((subtree, True))
+            stack.extend((child, False) for child in reversed(subtree.children) if child.total is None)
+
+    def _invalidate(self, key):
+        """key 的展開狀態改變：該節點的子樹重新建立，上層子樹的行數重新計算"""
+        pending = []
+        for subtree in self._by_key.get(key, ()):
+            subtree.children = None
+            subtree.total = None
+            pending.extend(subtree.parents)
+        while pending:
+            subtree = pending.pop()
+            if subtree.total is not None:
+                subtree.total = None
+                pending.extend(subtree.parents)
+
+    def _child_row(self, row, i):
+        entry = row.entry
+        subtree = row.subtree
+        task = subtree.tasks[i]
+        child = subtree.children[i]
+        # 行首只會用到最近 MAX_TREE_INDENT_DEPTH 層，只保留這部分，深層鏈的記憶體用量不隨深度平方增長
+        guides = (row.guides + (entry.is_last,))[-MAX_TREE_INDENT_DEPTH:] if entry.depth > 0 else ()
+        child_entry = TreeEntry(entry.depth + 1, i == len(subtree.children) - 1, task, entry.task,
+                                child.key, child.circular)
+        return TreeRow(child_entry, row, guides, child, i)
+
+    def _next_row(self, row):
+        """前序走訪的下一個可見位置"""
+        if row.subtree.children:
+            return self._child_row(row, 0)
+        while row.parent is not None:
+            parent = row.parent
+            if row.index + 1 < len(parent.subtree.children):
+                return self._child_row(parent, row.index + 1)
+            row = parent
+        return None
+
+    def _locate(self, logical):
+        """邏輯行 logical 所在的 (TreeRow, 該節點第一行)：從根依子樹行數往下走"""
+        self._update()
+        row = self.root
+        start = 0
+        while True:
+            subtree = row.subtree
+            offset = logical - start
+            if offset < subtree.line_count or not subtree.children:
+                return row, start
+            i = bisect_right(subtree.starts, offset) - 1
+            start += subtree.starts[i]
+            row = self._child_row(row, i)
+
+    def expand(self, row):
+        if row.expanded or not self.has_children(row):
+            return False
+        self.collapsed_keys.discard(row.entry.key)
+        self.expanded_keys.add(row.entry.key)
+        self._invalidate(row.entry.key)
+        return True
+
+    def collapse(self, row):
+        if not row.expanded:
+            return False
+        self.collapsed_keys.add(row.entry.key)
+        self.expanded_keys.discard(row.entry.key)
+        self._invalidate(row.entry.key)
+        return True
+
+    def toggle(self, row):
+        return self.collapse(row) if row.expanded else self.expand(row)
+
+    def refresh_line_counts(self):
+        """result 就地新增節點後（按需追蹤），重新建立子樹行數（待追蹤節點追蹤後行數與子節點會改變）"""
+        self._reset()
+
+    # --- 行 ---
+
+    def __len__(self):
+        """總行數（含空行模式下的空行）"""
+        self._update()
+        logical_lines = self._root.total
+        if self.add_empty_lines:
+            return max(logical_lines * 2 - 1, 0)
+        return logical_lines
+
+    def row_at(self, line_number):
+        """行號（從 0 開始）所在的 TreeRow；空行屬於上一個節點"""
+        logical = line_number // 2 if self.add_empty_lines else line_number
+        return self._locate(logical)[0]
+
+    def _row_lines(self, row):
+        entry = row.entry
+        line_prefix = tree_line_prefix(entry.depth, entry.is_last, row.guides)
+        return entry_lines(self.result, entry, line_prefix, self.display_mode)
+
+    def lines(self, start, stop):
+        """
+        行號 [start, stop) 的 [(行文字, [(tag, 起始欄, 結束欄)], TreeRow)]；
+        收合且有子節點的節點在第一行末加上 COLLAPSED_MARKER，空行屬於上一個節點。
+        """
+        stop = min(stop, len(self))
+        if start >= stop:
+            return []
+        step = 2 if self.add_empty_lines else 1
+        logical_start = start // step
+        logical_stop = (stop - 1) // step + 1
+        row, line = self._locate(logical_start)
+        logical = []
+        while row is not None and line < logical_stop:
+            for offset, (text, kind) in enumerate(self._row_lines(row)):
+                if logical_start <= line + offset < logical_stop:
+                    tags = line_tags(text, kind)
+                    if offset == 0 and not row.expanded:
+                        child_count = len(self._child_tasks(row))
+                        if child_count:
+                            marker_start = len(text)
+                            text += COLLAPSED_MARKER.format(count=child_count)
+                            tags.append(("collapsed_marker", marker_start, len(text)))
+                    logical.append((text, tags, row))
+            line += row.line_count
+            row = self._next_row(row)
+
+        if not self.add_empty_lines:
+            return logical
+        # 空行模式：邏輯行 n 在第 2n 行，之間各夾一個空行（最後一行之後沒有）
+        total = self._root.total
+        output = []
+        for i, item in enumerate(logical):
+            output.append(item)
+            if logical_start + i < total - 1:
+                output.append(("", [], item[2]))
+        offset = start - logical_start * 2
+        return output[offset:offset + stop - start]
+
+
+class VirtualTreeView:
+    """
+    把 TreeRows 顯示在既有的 Text 元件上：文字與行號元件只保留視窗內的行，
+    捲軸、滑鼠滾輪與視窗大小變更都只重新組出可見範圍；雙擊節點可展開 / 收合。
+    on_expand(key) 在節點展開前呼叫（例如按需追蹤其直接引用）。
+    """
+
+    def __init__(self, text_widget, line_number_widget=None, scrollbar=None, on_expand=None):
+        self.text = text_widget
+        self.on_expand = on_expand
+        self.gutter = line_number_widget
+        self.scrollbar = scrollbar if scrollbar is not None else getattr(text_widget, "vbar", None)
+        self.rows = None
+        self.first_line = 0
+        self._visible_rows = []  # 目前顯示的每一行對應的 TreeRow
+
+        if self.scrollbar is not None:
+            self.scrollbar.config(command=self.yview)
+        self.text.config(yscrollcommand="")
+        for widget in (self.text, self.gutter):
+            if widget is None:
+                continue
+            widget.bind("<MouseWheel>", self._on_mouse_wheel)
+            widget.bind("<Button-4>", lambda e: self._scroll_units(-3))
+            widget.bind("<Button-5>", lambda e: self._scroll_units(3))
+        self.text.bind("<Configure>", lambda e: self.refresh())
+        self.text.bind("<Double-Button-1>", self._on_double_click)
+        self.text.tag_configure("collapsed_marker", foreground="gray")
+
+    def show(self, rows, keep_position=False):
+        self.rows = rows
+        if not keep_position:
+            self.first_line = 0
+        self.refresh()
+
+    def clear(self):
+        self.rows = None
+        self.first_line = 0
+        self.refresh()
+
+    def visible_line_count(self):
+        try:
+            line_height = tkfont.Font(font=self.text.cget("font")).metrics("linespace") or 18
+        except tk.TclError:
+            line_height = 18
+        return max(self.text.winfo_height() // line_height, 1)
+
+    def _max_first_line(self, visible):
+        return max(len(self.rows) - visible, 0) if self.rows is not None else 0
+
+    def refresh(self):
+        visible = self.visible_line_count()
+        self.first_line = max(min(self.first_line, self._max_first_line(visible)), 0)
+        lines = self.rows.lines(self.first_line, self.first_line + visible + OVERSCAN_LINES) if self.rows else []
+
+        self.text.delete("1.0", tk.END)
+        self.text.insert("1.0", "\n".join(text for text, _, _ in lines))
+        spans = {}
+        for line_number, (_, tags, _) in enumerate(lines, 1):
+            for tag, start, end in tags:
+                if end > start:
+                    spans.setdefault(tag, []).extend((f"{line_number}.{start}", f"{line_number}.{end}"))
+        for tag, indices in spans.items():
+            self.text.tag_add(tag, *indices)
+        self._visible_rows = [row for _, _, row in lines]
+
+        if self.gutter is not None:
+            # 行號補到視窗底部，與原本的顯示方式一致
+            self.gutter.config(state="normal")
+            self.gutter.delete("1.0", tk.END)
+            self.gutter.insert("1.0", "\n".join(str(self.first_line + i + 1) for i in range(visible)))
+            self.gutter.config(state="disabled")
+
+        if self.scrollbar is not None:
+            total = len(self.rows) if self.rows else 0
+            if total <= visible:
+                self.scrollbar.set(0.0, 1.0)
+            else:
+                self.scrollbar.set(self.first_line / total, min((self.first_line + visible) / total, 1.0))
+
+    def yview(self, *args):
+        """捲軸指令：("moveto", 比例) 或 ("scroll", 數量, "units" / "pages")"""
+        if self.rows is None or not args:
+            return
+        visible = self.visible_line_count()
+        if args[0] == "moveto":
+            self.first_line = int(float(args[1]) * len(self.rows))
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            self.first_line += amount * visible if args[2] == "pages" else amount
+        self.refresh()
+
+    def _scroll_units(self, amount):
+        self.yview("scroll", amount, "units")
+        return "break"
+
+    def _on_mouse_wheel(self, event):
+        return self._scroll_units(int(-1 * (event.delta / 120)) * 3)
+
+    def _on_double_click(self, event):
+        if self.rows is None:
+            return None
+        line = int(self.text.index(f"@{event.x},{event.y}").split(".")[0]) - 1
+        if not 0 <= line < len(self._visible_rows):
+            return "break"
+        row = self._visible_rows[line]
+        if not row.expanded and self.on_expand is not None:
+            self.on_expand(row.entry.key)
+            self.rows.refresh_line_counts()
+        if self.rows.toggle(row):
+            self.refresh()
+        return "break"
@@ -0,0 +1,98 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+def get_file_fingerprint(file_path):
+    """返回檔案的 (mtime, size) 指紋；檔案不存在時返回 None"""
+    try:
+        stat_result = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat_result.st_mtime_ns, stat_result.st_size)
+
+
+class FingerprintLRUCache:
+    """
+    依檔案路徑 + (mtime, size) 指紋快取已載入的物件。
+    檔案被修改後舊項目自動失效；超過記憶體上限時以 LRU 順序淘汰。
+    記憶體用量以 size_estimator 估算（預設為檔案大小），不做深度量測。
+    """
+
+    def __init__(self, max_bytes, size_estimator=None, on_evict=None):
+        self.max_bytes = max_bytes
+        self._size_estimator = size_estimator or (lambda file_path, value: os.path.getsize(file_path))
+        self._on_evict = on_evict
+        self._entries = OrderedDict()  # key -> (fingerprint, value, estimated_bytes)
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+
+    def get(self, key, file_path, loader):
+        """
+        取得快取物件；不存在或檔案已變更時呼叫 loader() 重新載入。
+        loader 拋出的例外會直接向上傳遞，失敗的結果不會被快取。
+        """
+        fingerprint = get_file_fingerprint(file_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == fingerprint:
+                    self._entries.move_to_end(key)
+                    return entry[1]
+                self._discard(key)
+
+        value = loader()
+        try:
+            estimated_bytes = self._size_estimator(file_path, value)
+        except OSError:
+            estimated_bytes = 0
+
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+            self._entries[key] = (fingerprint, value, estimated_bytes)
+            self._total_bytes += estimated_bytes
+            self._evict_over_budget(keep_key=key)
+        return value
+
+    def _evict_over_budget(self, keep_key=None):
+        # 最近使用的項目即使單獨超過上限也保留，避免同一檔案反覆載入
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            oldest_key = next(iter(self._entries))
+            if oldest_key == keep_key:
+                break
+            self._discard(oldest_key)
+
+    def _discard(self, key):
+        _, value, estimated_bytes = self._entries.pop(key)
+        self._total_bytes -= estimated_bytes
+        if self._on_evict:
+            try:
+                self._on_evict(value)
+            except Exception:
+                pass
+
+    def set_max_bytes(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict_over_budget()
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._discard(key)
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
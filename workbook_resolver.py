@@ -3,25 +3,25 @@ import openpyxl
 import os
 import re
 
+# 輔助函數：把外部連結目標轉為公式中的路徑格式
+def _format_external_link_target(target_path):
+    if target_path.startswith('file:///'):
+        actual_path = target_path[len('file:///'):]
+        actual_path = actual_path.replace('\\', '\\\\')
+        actual_path = actual_path.replace('/', '\\\\')
+
+        dirname = os.path.dirname(actual_path)
+        basename = os.path.basename(actual_path)
+        return f"'{dirname}\\\\[{basename}]'"
+    return f"[{target_path}]"
+
 # 輔助函數：從工作簿中獲取外部連結映射
 def _get_external_link_map(workbook):
     external_link_map = {}
     if hasattr(workbook, '_external_links') and workbook._external_links:
         for i, link in enumerate(workbook._external_links):
             if hasattr(link, 'file_link') and hasattr(link.file_link, 'target'):
-                target_path = link.file_link.target
-                excel_formatted_path_part = ""
-                if target_path.startswith('file:///'):
-                    actual_path = target_path[len('file:///'):]
-                    actual_path = actual_path.replace('\\', '\\\\')
-                    actual_path = actual_path.replace('/', '\\\\')
-
-                    dirname = os.path.dirname(actual_path)
-                    basename = os.path.basename(actual_path)
-                    excel_formatted_path_part = f"'{dirname}\\\\[{basename}]'"
-                else:
-                    excel_formatted_path_part = f"[{target_path}]"
-                external_link_map[str(i + 1)] = excel_formatted_path_part
+                external_link_map[str(i + 1)] = _format_external_link_target(link.file_link.target)
     return external_link_map
 
 # 輔助函數：解析公式字串